@@ -0,0 +1,289 @@
+## Benchmarks for the engine and the UI's hot paths, rendering runs headless under SDL's dummy driver
+## Every case is timed as the best of a few repeats, each long enough to drown out the timer, and
+## the results (seconds per call) go to a JSON file. Comparing against an earlier file flags
+## anything that got slower by more than the threshold, and exits non-zero if something did
+##   python bench.py --out baseline.json
+##   python bench.py --baseline baseline.json --threshold 0.15
+##   python bench.py -k mineLoop
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import time
+from typing import Callable
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import numpy as np
+
+import simulation
+from factoryMechanics import Factory, FactoryBatch, Contract, CATALOG, RESOURCE_NAMES, TRADE_POSSIBILITIES
+
+## name -> setup, which builds whatever the case needs and returns the function to time
+BENCHMARKS: dict[str, Callable[[], Callable[[], object]]] = {}
+
+BUYABLE = [key for key, entry in CATALOG.items() if entry.can_buy_directly]
+RICH = 10**12  ## Enough of everything that nothing runs out however long a case runs
+
+
+## @benchmark('engine.x') registers a setup() as is, @benchmark('engine.x', sizes=(1, 10)) registers
+## one case per size as 'engine.x[1]', 'engine.x[10]', each calling setup(size)
+def benchmark(name: str, sizes: tuple[int, ...] = ()):
+    def register(setup):
+        if not sizes:
+            BENCHMARKS[name] = setup
+        for n in sizes:
+            BENCHMARKS[f'{name}[{n}]'] = lambda n=n: setup(n)
+        return setup
+    return register
+
+
+## A factory with n buildings, a mix of every type that can be bought
+def make_factory(n: int, name: str = 'bench'):
+    factory = Factory(name, [CATALOG[key].cls() for key in itertools.islice(itertools.cycle(BUYABLE), n)],
+                      [], max(n, 10))
+    for key in BUYABLE:
+        factory.add_ore(RESOURCE_NAMES[CATALOG[key].ore], RICH)
+    return factory
+
+
+## Engine
+
+## One collection cycle the old way round, every building mines and then gets emptied
+@benchmark('engine.mineLoop', sizes=(1, 10, 100, 1000))
+def bench_mine_loop(n: int):
+    factory = make_factory(n)
+
+    def run():
+        factory.mineLoop()
+        factory.mineLoop(collecting=True)
+    return run
+
+
+## One collection cycle for n factories at once, e.g. every player of n / 4 games in play_batch
+@benchmark('engine.FactoryBatch.mine', sizes=(4, 1000, 20000))
+def bench_batch_mine(n: int):
+    batch = FactoryBatch([make_factory(10, f'p{i}') for i in range(n)])
+    return lambda: batch.mine(1)
+
+
+@benchmark('engine.can_buy_cost')
+def bench_can_buy_cost():
+    factory = make_factory(5)
+    cost = CATALOG['TantalumMine'].cls.cost
+    return lambda: factory.can_buy_cost(cost)
+
+
+## Reads the affordability mask, which only gets recomputed after the stock changes
+@benchmark('engine.can_buy')
+def bench_can_buy():
+    factory = make_factory(5)
+    return lambda: factory.can_buy('TantalumMine')
+
+
+## Fills an empty factory, so this is 100 purchases per call
+@benchmark('engine.createBuilding[x100]')
+def bench_create_building():
+    def run():
+        factory = make_factory(0)
+        factory.capacity = 100
+        for key in itertools.islice(itertools.cycle(BUYABLE), 100):
+            factory.createBuilding(key)
+    return run
+
+
+## Both sides owe each other the same, so the inventories don't drift however often it's settled
+@benchmark('engine.checkFulfilled', sizes=(1, 10, 100))
+def bench_check_fulfilled(n: int):
+    ores = [t for t in TRADE_POSSIBILITIES if t != 'Increase slot']
+    terms = [(1, ore) for ore in itertools.islice(itertools.cycle(ores), n)]
+    p1, p2 = make_factory(5, 'p1'), make_factory(5, 'p2')
+    for factory in (p1, p2):
+        for ore in ores:
+            factory.add_ore(ore, RICH)
+    contract = Contract(p1, p2, terms, list(terms), 0)
+    return contract.checkFulfilled
+
+
+@benchmark('engine.score')
+def bench_score():
+    return make_factory(10).score
+
+
+@benchmark('engine.play_game')
+def bench_play_game():
+    rng = random.Random(0)
+    return lambda: simulation.Game.new(rng).play(simulation.greedy_policy)
+
+
+## UI, all on offscreen surfaces
+
+_ui = None
+
+
+## ui (and so pygame) only gets imported if a UI case is going to run
+def ui_module():
+    global _ui
+    if _ui is None:
+        import pygame
+        import ui
+        pygame.init()
+        _ui = ui
+    return _ui
+
+
+## A fresh four player game as main sets it up, without the window, music or action log
+def ui_setup(n_contracts: int = 0):
+    ui = ui_module()
+    game = simulation.Game.new(random.Random(0), names=['Red', 'Yellow', 'Green', 'Blue'])
+    state = ui.State()
+    state.game = game
+    players = [ui.Player(ui.pygame.Color(color), factory, lambda i=i: ui.SC_INFO.player_areas[i], game.contracts,
+                         state)
+               for i, (color, factory) in enumerate(zip(['Red', 'Yellow', 'Green', 'Blue'], game.factories))]
+    state.players = players
+    state.curr_player = players[0]
+    a, b = game.factories[:2]
+    for i in range(n_contracts):
+        game.add_contract(Contract(a, b, [(i % 7 + 1, 'Copper')], [(i % 5 + 1, 'Iron'), (1, 'Increase slot')],
+                                   game.max_turn))
+    screen = ui.pygame.Surface(ui.SC_INFO.sc_size, ui.pygame.SRCALPHA)
+    return ui, state, players, screen
+
+
+@benchmark('ui.demo_factory')
+def bench_demo_factory():
+    ui = ui_module()
+    rng = random.Random(0)
+    return lambda: ui.demo_factory(rng)
+
+
+@benchmark('ui.calc_score')
+def bench_calc_score():
+    ui, state, players, screen = ui_setup()
+    return players[0].calc_score
+
+
+## Nothing changes between frames, so this is the retained panel being put back on screen
+@benchmark('ui.render_area')
+def bench_render_area():
+    ui, state, players, screen = ui_setup()
+    player = players[0]
+    dest = ui.clamped_subsurf(screen, player.area)
+    return lambda: player.render_area(dest, 0.3)
+
+
+## Stock changes every frame, as it does whenever a turn goes by, so the wallet sections get redrawn
+@benchmark('ui.render_area[stock]')
+def bench_render_area_stock():
+    ui, state, players, screen = ui_setup()
+    player = players[0]
+    dest = ui.clamped_subsurf(screen, player.area)
+
+    def run():
+        state.game.add_ore(player.factory, 'Copper', 1)
+        player.render_area(dest, 0.3)
+    return run
+
+
+@benchmark('ui.render_contracts_area', sizes=(0, 10, 500))
+def bench_render_contracts_area(n: int):
+    ui, state, players, screen = ui_setup(n)
+    player = players[0]
+    dest = ui.clamped_subsurf(screen, player.area)
+    return lambda: player.render_contracts_area(dest, 0.3)
+
+
+@benchmark('ui.Overlay.display')
+def bench_overlay_display():
+    ui, state, players, screen = ui_setup()
+    overlay = ui.Overlay(lambda: ui.SC_INFO.overlay_area, state, players)
+    state.creating_contract = players[0].factory
+    dest = ui.clamped_subsurf(screen, overlay.area)
+    return lambda: overlay.display(dest)
+
+
+## Runs fn enough times to fill about min_time, returns the best seconds per call out of the repeats
+def measure(fn: Callable[[], object], repeat: int = 5, min_time: float = 0.05):
+    fn()  ## Warm up caches, the way every frame after the first finds them
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        calls = max(calls * 2, int(calls * min_time / max(elapsed, 1e-9) * 1.1))
+    times = [elapsed]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        times.append(time.perf_counter() - start)
+    return min(times) / calls, calls
+
+
+def run(names: list[str], repeat: int = 5, min_time: float = 0.05, stream=sys.stdout):
+    results = {}
+    for name in names:
+        seconds, calls = measure(BENCHMARKS[name](), repeat, min_time)
+        results[name] = {'seconds': seconds, 'calls': calls, 'repeat': repeat}
+        print(f'{name:<32}{seconds * 1e6:>14.2f} us', file=stream)
+    return results
+
+
+def environment():
+    info = {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    if _ui is not None:
+        info['pygame'] = _ui.pygame.version.ver
+    return info
+
+
+## {name: (baseline seconds, new seconds, ratio)} for every case in both, and the names that regressed
+def compare(baseline: dict, results: dict, threshold: float):
+    rows = {name: (baseline[name]['seconds'], r['seconds'], r['seconds'] / baseline[name]['seconds'])
+            for name, r in results.items() if name in baseline}
+    return rows, [name for name, (_, _, ratio) in rows.items() if ratio > 1 + threshold]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the engine and headless rendering')
+    parser.add_argument('-k', dest='pattern', default='', help='only run cases whose name contains this')
+    parser.add_argument('--out', default='bench.json', help='where to write the results (default: bench.json)')
+    parser.add_argument('--baseline', help='results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='slowdown that counts as a regression, as a fraction (default: 0.15)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.05, help='seconds per repeat (default: 0.05)')
+    parser.add_argument('--list', action='store_true', help='list the cases and exit')
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if args.pattern in name]
+    if args.list:
+        print('\n'.join(names))
+        sys.exit()
+    results = run(names, args.repeat, args.min_time)
+    with open(args.out, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        rows, regressed = compare(baseline, results, args.threshold)
+        print(f'\n{"case":<32}{"baseline us":>14}{"now us":>14}{"change":>9}')
+        for name, (old, new, ratio) in rows.items():
+            flag = '  REGRESSED' if name in regressed else ''
+            print(f'{name:<32}{old * 1e6:>14.2f}{new * 1e6:>14.2f}{ratio - 1:>+9.0%}{flag}')
+        missing = [name for name in names if name not in baseline]
+        if missing:
+            print(f'Not in the baseline: {", ".join(missing)}')
+        if regressed:
+            print(f'{len(regressed)} case(s) more than {args.threshold:.0%} slower than the baseline')
+            sys.exit(1)
@@ -1,6 +1,9 @@
-import pygame
-import sys
-import math
+import collections.abc
+import dataclasses
+import heapq
+from fractions import Fraction
+
+import numpy as np
 
 class Contract:
     ## Party1 and party2 are the two players signing the contract
@@ -33,151 +36,420 @@ class Contract:
     ## So the term format will be same as cost format for buildings at the moment
     ## (If we decide to introduce other items)
     def checkFulfilled(self):
-        print(self.terms1, self.terms2)
-        for term in self.terms1:
-            if term[1] == "Increase slot":
-                if self.party1.capacity >= term[0]+1:
-                    self.party2.capacity += term[0]
-                    self.party1.capacity -= term[0]
-                else:
-                    print("Party 1 has failed to fulfill the contract!")
-                    self.party1.blockedFromPlaying = 3
-                    break
-            else:
-                for ore1 in self.party1.ores:
-                    if ore1.type == term[1]:
-                        if round(ore1.amount, 3) >= term[0]:
-                            ore1.amount -= term[0]
-                            for ore2 in self.party2.ores:
-                                if ore2.type == term[1]:
-                                    ore2.amount += term[0]
-                        else:
-                            print("Party 1 has failed to fulfill the contract!")
-                            self.party1.blockedFromPlaying = 3
-                            break
-
-        for term in self.terms2:
-            if term[1] == "Increase slot":
-                if self.party2.capacity >= term[0]+1:
-                    self.party1.capacity += term[0]
-                    self.party2.capacity -= term[0]
-                else:
-                    print("Party 2 has failed to fulfill the contract!")
-                    self.party2.blockedFromPlaying = 3
-                    break
-            else:            
-                for ore2 in self.party2.ores:
-                    if ore2.type == term[1]:
-                        if round(ore2.amount, 3) >= term[0]:
-                            ore2.amount -= term[0]
-                            for ore1 in self.party1.ores:
-                                if ore1.type == term[1]:
-                                    ore1.amount += term[0]
-                        else:
-                            print("Party 2 has failed to fulfill the contract!")
-                            self.party2.blockedFromPlaying = 3
-                            break
+        for settlement in settle([self]):
+            for party in settlement.defaulted:
+                print(f"Party {1 if party is self.party1 else 2} has failed to fulfill the contract!")
+
+    ## (giver, receiver, ore amounts, machine slots) for each side of the contract
+    def sides(self):
+        return [(giver, receiver,
+                 cost_vector([term for term in terms if term[1] != "Increase slot"]),
+                 sum(n for n, t in terms if t == "Increase slot"))
+                for giver, receiver, terms in ((self.party1, self.party2, self.terms1),
+                                               (self.party2, self.party1, self.terms2))]
+
+
+## What happened to a contract when it was settled
+@dataclasses.dataclass
+class Settlement:
+    contract: Contract
+    fulfilled: bool
+    defaulted: list[Factory]  ## Parties that couldn't pay their side
+
+
+## Result of netting a turn's contracts, see clear
+@dataclasses.dataclass
+class Clearing:
+    parties: list[Factory]
+    net: np.ndarray  ## Net ore movement per party, one row each, over every contract that goes through
+    net_slots: np.ndarray  ## Net machine slots gained per party
+    ledger: list[Settlement]
+    insolvent: list[Factory]  ## Parties that can't cover their net position
+
+    ## Only the net positions get moved, never each contract's gross transfers
+    ## Given the batch the parties' inventories live in, that's one vector add over their rows
+    def apply(self, batch: FactoryBatch | None = None):
+        if batch is not None and all(party in batch.rows for party in self.parties):
+            batch.inventory[[batch.rows[party] for party in self.parties]] += self.net
+        else:
+            for party, net in zip(self.parties, self.net):
+                party.inventory += net
+        for party, net, slots in zip(self.parties, self.net, self.net_slots.tolist()):
+            party.inventory_changed()
+            party._list_ores(net)
+            party.capacity += slots
+        for party in self.insolvent:
+            party.blockedFromPlaying = 3
+
+
+## Multilateral netting of every contract due on the same turn
+## Obligations are netted per party and resource (A pays B, B pays C, C pays A cancels out), and a
+## party only has to cover its net position out of what it held before settlement, so the
+## result doesn't depend on the order of the contracts
+## A contract goes through in full only if neither side defaults, otherwise nothing moves and
+## whoever couldn't pay is blocked. Dropping a contract can leave someone else short of what they
+## were counting on, so this repeats until nobody new is insolvent (at most once per party)
+def clear(contracts: list[Contract]):
+    if not contracts:
+        return Clearing([], np.zeros((0, N_RESOURCES), dtype=AMOUNT_DTYPE), np.zeros(0, dtype=int), [], [])
+    parties: dict[Factory, int] = {}
+    for contract in contracts:
+        parties.setdefault(contract.party1, len(parties))
+        parties.setdefault(contract.party2, len(parties))
+    party_list = list(parties)
+
+    ## One row per side of every contract
+    sides = [side for contract in contracts for side in contract.sides()]
+    givers = np.array([parties[giver] for giver, receiver, amounts, slots in sides], dtype=int)
+    receivers = np.array([parties[receiver] for giver, receiver, amounts, slots in sides], dtype=int)
+    amounts = np.array([amounts for giver, receiver, amounts, slots in sides]).reshape(len(sides), N_RESOURCES)
+    slots = np.array([slots for giver, receiver, amounts, slots in sides], dtype=int)
+    obliged = amounts.any(axis=1) | (slots > 0)
+    held = np.array([party.inventory for party in party_list]).reshape(len(parties), N_RESOURCES)
+    capacity = np.array([party.capacity for party in party_list], dtype=int)
+
+    insolvent = np.zeros(len(parties), dtype=bool)
+    going_through = np.ones(len(contracts), dtype=bool)
+    while True:
+        ## Both sides of a contract stand or fall together
+        live = np.repeat(going_through, 2)
+        net = np.zeros_like(held)
+        np.add.at(net, givers[live], -amounts[live])
+        np.add.at(net, receivers[live], amounts[live])
+        net_slots = np.zeros_like(capacity)
+        np.add.at(net_slots, givers[live], -slots[live])
+        np.add.at(net_slots, receivers[live], slots[live])
+        short = (held + net < 0).any(axis=1) | ((net_slots < 0) & (capacity + net_slots < 1))
+        if not (short & ~insolvent).any():
+            break
+        insolvent |= short
+        going_through &= ~(obliged & insolvent[givers]).reshape(len(contracts), 2).any(axis=1)
+
+    defaulted = (obliged & insolvent[givers]).reshape(len(contracts), 2)
+    ledger = [Settlement(contract, bool(ok), [party for party, d in zip((contract.party1, contract.party2), ds) if d])
+              for contract, ok, ds in zip(contracts, going_through, defaulted)]
+    return Clearing(party_list, net, net_slots, ledger, [p for p, bad in zip(party_list, insolvent) if bad])
+
+
+## Settles every contract due on the same turn as one transaction and returns the ledger
+## Pass the parties' FactoryBatch, if they have one, to move every inventory at once
+def settle(contracts: list[Contract], batch: FactoryBatch | None = None):
+    if not contracts:
+        return []  ## Most turns, and not worth building any arrays for
+    clearing = clear(contracts)
+    clearing.apply(batch)
+    return clearing.ledger
+
+
+## Live contracts, bucketed by the turn they're due and indexed by party
+## Settling a turn only touches the contracts due then, and settled or dead contracts drop out
+class ContractScheduler:
+    def __init__(self, contracts: list[Contract] = ()):
+        self.due: dict[int, list[Contract]] = {}
+        self.deadlines: list[int] = []  ## Heap of the keys of self.due
+        self.by_party: dict[Factory, dict[Contract, None]] = {}  ## Dicts as insertion-ordered sets
+        self.revision = 0  ## Goes up whenever a contract is added or removed, so views know to refresh
+        for contract in contracts:
+            self.add(contract)
+
+    def add(self, contract: Contract):
+        if contract.timeLimit not in self.due:
+            self.due[contract.timeLimit] = []
+            heapq.heappush(self.deadlines, contract.timeLimit)
+        self.due[contract.timeLimit].append(contract)
+        for party in (contract.party1, contract.party2):
+            self.by_party.setdefault(party, {})[contract] = None
+        self.revision += 1
+
+    def _forget(self, contract: Contract):
+        for party in (contract.party1, contract.party2):
+            self.by_party[party].pop(contract, None)
+        self.revision += 1
+
+    ## Takes the contracts due on turn t out of the schedule
+    def pop_due(self, t: int):
+        contracts = self.due.pop(t, [])
+        for contract in contracts:
+            self._forget(contract)
+        return contracts
+
+    ## A party left the game, everything they signed is dead
+    def drop_party(self, party: Factory):
+        for contract in list(self.by_party.get(party, ())):
+            contract.dead = True
+            self._forget(contract)
+            self.due[contract.timeLimit].remove(contract)
+
+    def for_party(self, party: Factory):
+        return self.by_party.get(party, {}).keys()
+
+    ## First turn after t that has contracts due, or None
+    ## (anything still waiting on a turn that's already gone will never be settled, so it's dropped)
+    def next_deadline(self, t: int):
+        while self.deadlines and (self.deadlines[0] <= t or not self.due.get(self.deadlines[0])):
+            for contract in self.due.pop(heapq.heappop(self.deadlines), []):
+                self._forget(contract)
+        return self.deadlines[0] if self.deadlines else None
+
+    def __iter__(self):
+        for contracts in self.due.values():
+            yield from contracts
+
+    def __len__(self):
+        return sum(len(contracts) for contracts in self.due.values())
 
 
 ## Each player will have their own factory
+## Ores are held in a single vector of milli-units indexed by RESOURCE_IDS, self.ores are just views into it
+## Buildings aren't objects either: each slot is one byte (see slot_code) kept in build order for display,
+## alongside a count per (type, boosted), so mining costs the same however many slots there are
 class Factory:
     def __init__(self, name, buildings: list[Building], ores: list[Ore], capacity: int):
         self.name = name
-        self.buildings = buildings
-        self.ores = ores
+        self.inventory = np.zeros(N_RESOURCES, dtype=AMOUNT_DTYPE)
+        self._affordable: int | None = None  ## See affordable, None until it's next asked for
+        self.ores: list[Ore] = []
+        self._listed: set[int] = set()
+        for ore in ores:
+            self._add(ore.id, ore.milli)
+        self.slots = bytearray()  ## slot_code of every slot, in build order
+        self.counts = np.zeros(len(SLOT_KINDS), dtype=np.int64)  ## Slots per slot_code
+        self.buildings = BuildingSlots(self.slots)
+        ## Production per collection cycle, kept up to date as buildings are added and boosted
+        self.production = np.zeros(N_RESOURCES, dtype=AMOUNT_DTYPE)
+        self._uncollected = np.zeros(N_RESOURCES, dtype=AMOUNT_DTYPE)  ## Mined but not collected yet
+        self._pending = False  ## Set when there's uncollected ore
+        for building in buildings:
+            self._place(slot_code(type(building).key, building.boosted))
+            self._uncollected[building.ore.id] += building.ore.milli
+            self._pending = self._pending or building.ore.milli != 0
         self.capacity = capacity
         self.boosted = False
         self.blockedFromPlaying = 0 ## Made positive when the party can't play due to failing a contract
 
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @capacity.setter
+    def capacity(self, capacity: int):
+        self._capacity = capacity
+        self._affordable = None
+
+    ## Anything that writes to self.inventory without going through the methods
+    ## below has to call this, so the affordability mask gets worked out again
+    def inventory_changed(self):
+        self._affordable = None
+
+    ## Bitmask of what can be done right now, BUILD_BITS[buildingType] for each building type and
+    ## BOOST_BIT for boosting. Only recomputed after the stock, buildings or capacity changed, so asking
+    ## is O(1) however often bots and the UI do it
+    @property
+    def affordable(self):
+        if self._affordable is None:
+            mask = int((AFFORD_COSTS <= self.inventory).all(axis=1) @ AFFORD_WEIGHTS)
+            if len(self.buildings) >= self._capacity:
+                mask &= BOOST_BIT
+            self._affordable = mask
+        return self._affordable
+
+    ## amounts in milli-units, see cost_vector
+    def has_amounts(self, amounts: np.ndarray):
+        return not (self.inventory < amounts).any()
+
     def can_buy_cost(self, cost: list[tuple[int, str]]):
         if len(self.buildings) >= self.capacity:
             return
-        for oreCost in cost:
-            for ore in self.ores:
-                if ore.type == oreCost[1]:
-                    if round(ore.amount, 3) < oreCost[0]:
-                        return False
-        return True
+        return self.has_amounts(cost_vector(cost))
 
     def can_buy(self, buildingType: str):
-        building = MINE_CLASSES[buildingType]()
-        return self.can_buy_cost(building.cost)
+        return bool(self.affordable & BUILD_BITS[buildingType])
+
+    ## Enough fire opal to boost a machine
+    def can_boost(self):
+        return bool(self.affordable & BOOST_BIT)
+
+    ## Makes sure every resource in amounts has a view in self.ores, so the UI shows it
+    def _list_ores(self, amounts: np.ndarray):
+        for i in np.flatnonzero(amounts):
+            if i not in self._listed:
+                self._listed.add(i)
+                self.ores.append(RESOURCE_CLASSES[RESOURCE_NAMES[i]].view(self))
 
+    ## n is in whole units, like everything that comes from outside the engine
     def add_ore(self, o: str, n: int):
-        for o2 in self.ores:
-            if o2.type == o:
-                o2.amount += n
-                return
-        self.ores.append(RESOURCE_CLASSES[o](n))
+        self._add(RESOURCE_IDS[o], to_milli(n))
+
+    def _add(self, i: int, milli: int):
+        self.inventory[i] += milli
+        self._affordable = None
+        if i not in self._listed:
+            self._listed.add(i)
+            self.ores.append(RESOURCE_CLASSES[RESOURCE_NAMES[i]].view(self))
 
     # Creates building based on what player selects and if they have enough ores to buy it + if they are not above the current building limit
     def createBuilding(self, buildingType):
         if buildingType == "":
             return
-        building = MINE_CLASSES[buildingType]()
-        cost = building.cost
         if (len(self.buildings) >= self.capacity):
             print("You have reached the maximum build limit")
             return
-        for oreCost in cost:
-            for ore in self.ores:
-                if ore.type == oreCost[1]:
-                    if round(ore.amount, 3) >= oreCost[0]:
-                        continue
-                    else:
-                        print("You cannot afford this!")
-                        return
-        for oreCost in cost:
-            for ore in self.ores:
-                if ore.type == oreCost[1]:
-                    ore.amount -= oreCost[0]
-        self.buildings.append(building)
+        entry = CATALOG[buildingType]
+        if not self.has_amounts(entry.cost):
+            print("You cannot afford this!")
+            return
+        self.inventory -= entry.cost
+        self._place(slot_code(buildingType, False))
+
+    ## Puts a building in the next slot without paying for it, e.g. when loading a save
+    def place(self, buildingType: str, boosted: bool = False):
+        self._place(slot_code(buildingType, boosted))
+
+    def _place(self, code: int):
+        self.slots.append(code)
+        self.counts[code] += 1
+        self.production += SLOT_RATES[code]
+        self._add(SLOT_KINDS[code].kind.ore, 0)  ## Also marks the mask stale, as the building count changed
 
     ## Spend a fire opal to increase production of a machine
     def increaseProduction(self, buildingNumber):
-        for ore in self.ores:
-            if ore.type == "FireOpal" and self.buildings[buildingNumber].boosted == False:
-                if ore.amount >= 1:
-                    self.buildings[buildingNumber].productionRate *= 2
-                    self.buildings[buildingNumber].boosted = True
-                    ore.amount -= 1
+        code = self.slots[buildingNumber]
+        if not code & BOOSTED_SLOT and self.inventory[FIRE_OPAL] >= MILLI:
+            self.slots[buildingNumber] = code | BOOSTED_SLOT
+            self.counts[code] -= 1
+            self.counts[code | BOOSTED_SLOT] += 1
+            self.production += SLOT_RATES[code]  ## Boosting doubles the rate, i.e. adds it once more
+            self.inventory[FIRE_OPAL] -= MILLI
+            self._affordable = None
 
     ## All the buildings mine their ores, collects ore from building periodically
     def mineLoop(self, collecting=False):
-        for building in self.buildings:
-            building.mine()
-
-        oreDict = {building.ore.type : 0 for building in self.buildings}
-        for building in self.buildings:
-            oreDict[building.ore.type] += building.ore.amount
-
         if collecting:
-            for ore in self.ores:
-                if ore.type in oreDict:
-                    ore.amount += oreDict[ore.type]
-
-            for building in self.buildings:
-                building.ore.amount = 0
+            self.fast_forward(1)
+            return
+        self._uncollected += self.production
+        self._pending = True
+
+    ## Same as n calls to mineLoop(collecting=True), but production is linear so it's just rate * n
+    def fast_forward(self, n: int):
+        if self._pending:
+            self.inventory += self._uncollected
+            self._uncollected[:] = 0
+            self._pending = False
+        ## Everything a building produces is already listed in self.ores
+        self.inventory += self.production * n
+        self._affordable = None
+
+    ## Held ores are worth their value, a full gem set gives a bonus, otherwise dragon eggs multiply the score
+    def score(self):
+        score = int(self.inventory @ RESOURCE_VALUES) / MILLI
+        if (self.inventory[SPECIAL_ORES] >= MILLI).all():
+            score += 8000
+        else:
+            score = score*1.2**(int(self.inventory[DRAGON_EGG]) / MILLI)
+        return score
 
     def getOres(self):
-        for building in self.buildings:
-            print(f'{building.name} | {building.ore.type} | {building.ore.amount:.2f}')
+        for code in np.flatnonzero(self.counts):
+            slot = SLOT_KINDS[code]
+            print(f'{self.counts[code]} x {slot.kind.name}{" (boosted)" if slot.boosted else ""} | '
+                  f'{RESOURCE_NAMES[slot.kind.ore]} | {format_amount(SLOT_RATES[code, slot.kind.ore])}/cycle')
+        for ore in np.flatnonzero(self._uncollected):
+            print(f'Uncollected {RESOURCE_NAMES[ore]} | {format_amount(self._uncollected[ore])}')
 
         print('')
         for i in self.ores:
-            print(f'Total {i.type} | {i.amount:.2f}')
+            print(f'Total {i.type} | {format_amount(i.milli)}')
+
+
+## Factories that mine in lockstep, e.g. the players of one game or of thousands of simulated games
+## Owns one matrix each of inventories, slot counts and production, a row per factory, and each
+## factory's vectors become views onto its rows. Factory's own methods keep everything up to date
+## (production is always counts @ SLOT_RATES), and a collection cycle for every factory at once is
+## a single multiply-add
+class FactoryBatch:
+    def __init__(self, factories: list[Factory]):
+        self.factories = list(factories)
+        self.rows = {factory: i for i, factory in enumerate(self.factories)}
+        self.due = np.zeros(len(self.factories), dtype=np.int64)  ## Collection cycles owed to each factory
+        self.inventory = self._adopt('inventory')
+        self.counts = self._adopt('counts')
+        self.production = self._adopt('production')
+        self.uncollected = self._adopt('_uncollected')
+
+    ## Stacks every factory's vector into one matrix and points the factories at its rows
+    def _adopt(self, name: str):
+        width = len(getattr(self.factories[0], name)) if self.factories else 0
+        matrix = np.array([getattr(f, name) for f in self.factories], dtype=np.int64)
+        matrix = matrix.reshape(len(self.factories), width)
+        for factory, row in zip(self.factories, matrix):
+            setattr(factory, name, row)
+        return matrix
+
+    ## Collects whatever's uncollected and runs every factory's owed cycles (self.due, or cycles if given)
+    ## Most turns nobody is owed anything (cycles only come round once per round), so that's a no-op
+    ## (count_nonzero rather than any(), it skips the ufunc machinery and that adds up every turn)
+    def mine(self, cycles: int | np.ndarray | None = None):
+        collecting = np.count_nonzero(self.uncollected)
+        if cycles is None and not collecting and not np.count_nonzero(self.due):
+            return
+        due = self.due if cycles is None else np.broadcast_to(cycles, self.due.shape)
+        self.inventory += self.production * due[:, None]
+        changed = due.nonzero()[0].tolist()
+        if collecting:
+            self.inventory += self.uncollected
+            self.uncollected[:] = 0
+            changed = range(len(self.factories))
+        self.due[:] = 0
+        ## (Factory._pending can stay set, collecting nothing again is harmless)
+        ## Only the factories that got something need their affordability worked out again
+        for i in changed:
+            self.factories[i]._affordable = None
 
 
 ## Have subclasses for different types of ores
+## An Ore either holds its own amount (e.g. the ore sitting in a building) or is a view
+## onto a factory's inventory vector, see Ore.view
+## Amounts are kept in milli-units (Ore.milli), Ore.amount is the same in whole units for display
 class Ore:
     name: str
 
     def __init__(self, amount, type, colour, value):
-        self.amount: int = amount
+        self._milli = to_milli(amount)
+        self._factory: Factory | None = None
         self.type: str = type
+        self.id: int = RESOURCE_IDS[type]
         self.colour = colour
         self.value = value
 
+    @classmethod
+    def view(cls, factory: Factory):
+        ore = cls(0)
+        ore._factory = factory
+        return ore
+
+    @property
+    def milli(self):
+        if self._factory is None:
+            return self._milli
+        return int(self._factory.inventory[self.id])
+
+    @milli.setter
+    def milli(self, milli: int):
+        if self._factory is None:
+            self._milli = milli
+        else:
+            self._factory.inventory[self.id] = milli
+            self._factory.inventory_changed()
+
+    @property
+    def amount(self):
+        return self.milli / MILLI
+
+    @amount.setter
+    def amount(self, amount):
+        self.milli = to_milli(amount)
+
 class Copper(Ore):
     name = 'Copper'
 
@@ -233,7 +505,10 @@ class NullResource(Ore):
         super().__init__(amount, "NullResource", (255, 0, 0, 0), 0)
 
 # Add capability to mine multiple ores with same building
+## Building types are plain data: anything not set on a subclass comes from the class attributes,
+## and define_building makes new types without writing a subclass at all
 class Building:
+    key: str  ## Its key in MINE_CLASSES and CATALOG, set when it's catalogued
     cost: list[tuple[int, str]]
     name: str
     produces: type[Ore]
@@ -244,15 +519,13 @@ class Building:
     def get_abbreviation(cls):
         return ''.join(w[0] for w in cls.name.split())
 
-    def __init__(self, name: str, oreType, productionRate):
-        self.name = name
-        self.ore: Ore = oreType(0)
-        self.productionRate = productionRate
+    def __init__(self, name: str | None = None, oreType=None, productionRate=None):
+        cls = type(self)
+        self.name = cls.name if name is None else name
+        self.ore: Ore = (cls.produces if oreType is None else oreType)(0)
+        self.productionRate = cls.productionRate if productionRate is None else productionRate
         self.boosted = False
 
-    def mine(self):
-        self.ore.amount += self.productionRate
-
 class BlockedSlot(Building):
     cost = [(0, "NullResource")]
     name = "BlockedSlot"
@@ -323,6 +596,153 @@ RESOURCE_CLASSES = {"Copper":Copper, "Iron":Iron, "Titanium":Titanium, "Tantalum
 TRADE_POSSIBILITIES = list(RESOURCE_CLASSES) + ["Increase slot"]
 TRADE_POSSIBILITIES.remove('NullResource')
 
+## Amounts are fixed point, in integer thousandths of a unit, so sums and comparisons are exact
+MILLI = 1000
+AMOUNT_DTYPE = np.int64
+
+## Converts an amount in whole units (an int, float or decimal string) to milli-units, rounded to the
+## nearest one. Goes through the decimal string so 0.1 means 0.1 rather than the double nearest to it,
+## and float noise like 0.1 + 0.2 = 0.30000000000000004 rounds away instead of being an error
+def to_milli(amount):
+    if type(amount) is int:
+        return amount * MILLI
+    if isinstance(amount, (int, np.integer)):
+        return int(amount) * MILLI
+    return round(Fraction(str(amount)) * MILLI)
+
+## Milli-units as a decimal string, without trailing zeros: 1500 -> '1.5', 3000 -> '3'
+def format_amount(milli: int):
+    whole, frac = divmod(abs(int(milli)), MILLI)
+    sign = '-' if milli < 0 else ''
+    return f'{sign}{whole}.{frac:03}'.rstrip('0') if frac else f'{sign}{whole}'
+
+## Resources are interned as small ints so inventories and costs can be dense vectors
+RESOURCE_NAMES = list(RESOURCE_CLASSES)
+RESOURCE_IDS = {name: i for i, name in enumerate(RESOURCE_NAMES)}
+N_RESOURCES = len(RESOURCE_NAMES)
+FIRE_OPAL = RESOURCE_IDS["FireOpal"]
+DRAGON_EGG = RESOURCE_IDS["DragonEgg"]
+SPECIAL_ORES = [RESOURCE_IDS[o] for o in ["DragonEgg", "FireOpal", "Elbaite", "Yooperlite"]]
+RESOURCE_VALUES = np.array([cls(0).value for cls in RESOURCE_CLASSES.values()], dtype=AMOUNT_DTYPE)
+
+## Costs and contract terms are in whole units, the vector is in milli-units
+def cost_vector(cost: list[tuple[int, str]]):
+    vec = np.zeros(N_RESOURCES, dtype=AMOUNT_DTYPE)
+    for n, resource in cost:
+        vec[RESOURCE_IDS[resource]] += to_milli(n)
+    return vec
+
+
+## Everything about a building type that never changes, worked out once so that affordability checks,
+## purchases and the buy buttons are lookups rather than building a throwaway instance
+@dataclasses.dataclass(frozen=True, eq=False)
+class BuildingType:
+    key: str
+    cls: type[Building]
+    name: str
+    abbreviation: str
+    ore: int  ## RESOURCE_IDS of what it produces
+    rate: int  ## Milli-units per cycle, unboosted
+    cost: np.ndarray  ## Milli-units, read-only
+    production: np.ndarray  ## rate in the ore's slot, read-only
+    label: str  ## What its buy button says
+    can_buy_directly: bool
+
+    @classmethod
+    def from_class(cls, key: str, building: type[Building]):
+        ore = RESOURCE_IDS[building.produces.name]
+        rate = to_milli(building.productionRate)
+        cost = cost_vector(building.cost)
+        production = np.zeros(N_RESOURCES, dtype=AMOUNT_DTYPE)
+        production[ore] = rate
+        cost.flags.writeable = production.flags.writeable = False
+        label = (f'{building.get_abbreviation()}: {building.productionRate} {building.produces.name}/round (COST: '
+                 + ', '.join(f'{n} {ore_s}' for n, ore_s in sorted(building.cost, key=lambda c: c[1])) + ')')
+        building.key = key
+        return cls(key, building, building.name, building.get_abbreviation(), ore, rate, cost, production, label,
+                   building.can_buy_directly)
+
+
+CATALOG = {key: BuildingType.from_class(key, cls) for key, cls in MINE_CLASSES.items()}
+
+
+## What's in a factory slot
+@dataclasses.dataclass(frozen=True)
+class Slot:
+    kind: BuildingType
+    boosted: bool
+
+
+## Factory.slots holds one byte per slot: twice the building type's index in CATALOG, plus one if boosted
+BOOSTED_SLOT = 1
+
+
+def slot_code(buildingType: str, boosted: bool):
+    return SLOT_INDEX[buildingType] << 1 | boosted
+
+
+## Read-only view of a factory's slots in build order, as Slot(kind, boosted)
+class BuildingSlots(collections.abc.Sequence):
+    __slots__ = ('_codes',)
+
+    def __init__(self, codes: bytearray):
+        self._codes = codes
+
+    def __len__(self):
+        return len(self._codes)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [SLOT_KINDS[code] for code in self._codes[i]]
+        return SLOT_KINDS[self._codes[i]]
+
+
+## Lookup tables worked out from the catalog, and again whenever a type is added:
+##   BUILD_BITS, BOOST_BIT   bit layout of Factory.affordable, one bit per type in catalog order, then boosting
+##   AFFORD_COSTS            every cost stacked into a matrix, so the whole mask is a single comparison
+##   SLOT_INDEX, SLOT_KINDS  what each slot_code stands for
+##   SLOT_RATES              production per cycle of one slot, per slot_code
+##   BUILDING_KEYS           every type's key in catalog order
+##   BUYABLE_TYPES           the ones that can be bought, priciest first (cost @ RESOURCE_VALUES)
+## (the dicts and lists are updated in place, as other modules import them)
+def _compile_tables():
+    global BOOST_BIT, AFFORD_COSTS, AFFORD_WEIGHTS, SLOT_RATES
+    BUILD_BITS.update({key: 1 << i for i, key in enumerate(CATALOG)})
+    SLOT_INDEX.update({key: i for i, key in enumerate(CATALOG)})
+    BUILDING_KEYS[:] = CATALOG
+    BUYABLE_TYPES[:] = sorted((key for key, entry in CATALOG.items() if entry.can_buy_directly),
+                              key=lambda key: int(CATALOG[key].cost @ RESOURCE_VALUES), reverse=True)
+    SLOT_KINDS[:] = [Slot(entry, boosted) for entry in CATALOG.values() for boosted in (False, True)]
+    SLOT_RATES = np.array([entry.production * (1 + boosted) for entry in CATALOG.values() for boosted in (0, 1)])
+    BOOST_BIT = 1 << len(CATALOG)
+    AFFORD_COSTS = np.array([entry.cost for entry in CATALOG.values()] + [cost_vector([(1, "FireOpal")])])
+    AFFORD_WEIGHTS = 1 << np.arange(len(CATALOG) + 1, dtype=np.int64)
+
+
+BUILD_BITS: dict[str, int] = {}
+SLOT_INDEX: dict[str, int] = {}
+SLOT_KINDS: list[Slot] = []
+BUILDING_KEYS: list[str] = []
+BUYABLE_TYPES: list[str] = []
+_compile_tables()
+
+
+## Adds a building type from data alone, e.g.
+##   define_building("DeepIronMine", "Deep Iron Mine", "Iron", 15, [(40, "Copper"), (10, "Titanium")])
+## Define any new types before making any factories, as a factory sizes its counts by the catalog
+## (savegame, the policies and the UI's tiles all pick new types up as they're defined)
+def define_building(key: str, name: str, produces: str, productionRate: float, cost: list[tuple[int, str]],
+                    abbreviation: str | None = None, can_buy_directly: bool = True):
+    attrs = {'name': name, 'produces': RESOURCE_CLASSES[produces], 'productionRate': productionRate,
+             'cost': list(cost), 'can_buy_directly': can_buy_directly}
+    if abbreviation is not None:
+        attrs['get_abbreviation'] = classmethod(lambda cls: abbreviation)
+    building = type(key, (Building,), attrs)
+    MINE_CLASSES[key] = building
+    CATALOG[key] = BuildingType.from_class(key, building)
+    _compile_tables()
+    return CATALOG[key]
+
 if __name__ == '__main__':
     factory1 = Factory("p1", [CopperMineBasic()], [Copper(2), Iron(0), Titanium(0), Tantalum(0), FireOpal(0)], 10)
     factory2 = Factory("p2", [CopperMineBasic()], [Copper(2), Iron(0), Titanium(0), Tantalum(0), FireOpal(0)], 10)
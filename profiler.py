@@ -0,0 +1,110 @@
+## Per-frame timings for ui.main, split into stages (events, rendering, flip...)
+## Keeps a rolling window for the on-screen p50/p95/p99 table (F3) and can stream one JSON line
+## per frame to a file. While neither is on, stage() hands back a shared do-nothing context manager
+##   python ui.py --profile frames.jsonl
+##   python profiler.py frames.jsonl
+import collections
+import contextlib
+import json
+import time
+from typing import TextIO
+
+import numpy as np
+
+PERCENTILES = (50, 95, 99)
+
+_NOT_TIMING = contextlib.nullcontext()
+
+
+class _Stage:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler: FrameProfiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        frame = self.profiler.frame
+        frame[self.name] = frame.get(self.name, 0.0) + time.perf_counter() - self.start
+
+
+class FrameProfiler:
+    def __init__(self, stream: TextIO | None = None, window: int = 600):
+        self.stream = stream
+        self.show = False  ## Whether the on-screen table is up
+        self.window = window
+        self.history: dict[str, collections.deque[float]] = {}
+        self.frame: dict[str, float] = {}  ## Seconds per stage so far this frame
+        self.frames = 0
+        self._stages: dict[str, _Stage] = {}
+        self._frame_start = 0.0
+
+    @property
+    def enabled(self):
+        return self.show or self.stream is not None
+
+    def toggle(self):
+        self.show = not self.show
+        self._frame_start = time.perf_counter()
+
+    def begin_frame(self):
+        if self.enabled:
+            self._frame_start = time.perf_counter()
+
+    ## with profiler.stage('flip'): ...
+    def stage(self, name: str):
+        if not self.enabled:
+            return _NOT_TIMING
+        if name not in self._stages:
+            self._stages[name] = _Stage(self, name)
+        return self._stages[name]
+
+    ## Nothing got drawn after all, e.g. the only event was music ending
+    def cancel_frame(self):
+        self.frame = {}
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        frame = self.frame
+        frame['frame'] = time.perf_counter() - self._frame_start
+        for name, seconds in frame.items():
+            if name not in self.history:
+                self.history[name] = collections.deque(maxlen=self.window)
+            self.history[name].append(seconds)
+        if self.stream is not None:
+            self.stream.write(json.dumps({'frame': self.frames, 'ms': {k: round(v * 1000, 4) for k, v in frame.items()}})
+                              + '\n')
+        self.frames += 1
+        self.frame = {}
+
+    ## {stage: (p50, p95, p99)} in milliseconds over the last `window` frames
+    def percentiles(self):
+        return {name: tuple(np.percentile(samples, PERCENTILES) * 1000)
+                for name, samples in self.history.items() if samples}
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+
+## Same table as the overlay, for a file written with --profile
+def summarize(path: str):
+    history: dict[str, list[float]] = collections.defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            for name, ms in json.loads(line)['ms'].items():
+                history[name].append(ms)
+    return {name: (len(samples), *np.percentile(samples, PERCENTILES)) for name, samples in history.items()}
+
+
+if __name__ == '__main__':
+    import sys
+
+    print(f'{"stage":<14}{"frames":>8}' + ''.join(f'{f"p{p} ms":>10}' for p in PERCENTILES))
+    for name, (n, *ps) in sorted(summarize(sys.argv[1]).items(), key=lambda item: -item[1][-1]):
+        print(f'{name:<14}{n:>8}' + ''.join(f'{p:>10.3f}' for p in ps))
@@ -0,0 +1,176 @@
+## Append-only action log and deterministic replay
+## The log starts with a savegame snapshot of the game as it was when logging began, followed by one
+## compact record per action (see Game._record). Replaying is just loading the snapshot and
+## calling the same Game methods again, headless, with periodic checkpoints for seeking
+##   python replay.py game.sisl --turn 12
+import bisect
+import mmap
+import os
+import struct
+import time
+
+import savegame
+from factoryMechanics import RESOURCE_NAMES, RESOURCE_IDS
+from simulation import Game
+
+MAGIC = b'SISL'
+LOG_VERSION = 1
+
+HEADER = struct.Struct('<4sHxxQI')  ## magic, version, seed, snapshot length
+NO_SEED = 2**64 - 1  ## Stands in for the seed when it isn't known, e.g. a log started from a resumed save
+EVENT = struct.Struct('<BBH')  ## action, player (NO_PLAYER if none), turn
+NO_PLAYER = 255
+
+ACTIONS = ['next_turn', 'advance_to', 'skip_blocked', 'build', 'boost', 'add_ore', 'petrify', 'kill',
+           'propose', 'reject', 'add_contract']
+ACTION_IDS = {action: i for i, action in enumerate(ACTIONS)}
+## Fixed-size arguments per action, contracts are encoded with savegame.encode_contract instead
+ARGS = {
+    'advance_to': struct.Struct('<H'),
+    'build': struct.Struct('<B'),
+    'boost': struct.Struct('<H'),
+    'add_ore': struct.Struct('<Bi'),
+}
+CONTRACT_ACTIONS = {'propose', 'reject', 'add_contract'}
+
+
+class ActionLog:
+    def __init__(self, f):
+        self.f = f
+
+    ## Starts a new log at path, beginning from the game's current state (so a resumed game's log
+    ## starts from the save it was resumed from). seed is only recorded for reference, replays go by
+    ## the snapshot, which holds the rng state
+    @classmethod
+    def create(cls, path: str | os.PathLike, game: Game, seed: int | None = None):
+        f = open(path, 'wb')
+        snapshot = savegame.dumps(game)
+        f.write(HEADER.pack(MAGIC, LOG_VERSION, NO_SEED if seed is None else seed, len(snapshot)) + snapshot)
+        f.flush()
+        return cls(f)
+
+    def record(self, game: Game, action: str, factory, *args):
+        player = NO_PLAYER if factory is None else game.factories.index(factory)
+        out = EVENT.pack(ACTION_IDS[action], player, game.t)
+        if action in CONTRACT_ACTIONS:
+            out += savegame.encode_contract(game.factories, args[0])
+        elif action == 'build':
+            out += ARGS[action].pack(savegame.BUILDING_TYPES.index(args[0]))
+        elif action == 'add_ore':
+            out += ARGS[action].pack(RESOURCE_IDS[args[0]], args[1])
+        elif action in ARGS:
+            out += ARGS[action].pack(*args)
+        self.f.write(out)
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+class Replayer:
+    def __init__(self, buffer, checkpoint_every: int = 4):
+        self.buffer = buffer
+        magic, version, seed, snapshot_len = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise savegame.SaveError('Not an action log')
+        if version != LOG_VERSION:
+            raise savegame.SaveError(f'Log is version {version}, expected {LOG_VERSION}')
+        self.seed = None if seed == NO_SEED else seed
+        self.initial = bytes(buffer[HEADER.size:HEADER.size + snapshot_len])
+        self.events = self._index(HEADER.size + snapshot_len)
+        self.checkpoint_every = checkpoint_every
+        ## (turn, index of the next event, snapshot), in turn order
+        self.checkpoints: list[tuple[int, int, bytes]] = []
+
+    @classmethod
+    def open(cls, path: str | os.PathLike, **kwargs):
+        with open(path, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), **kwargs)
+
+    ## (action, player, turn, offset of the arguments) for every complete event in the log
+    def _index(self, offset: int):
+        events = []
+        while offset + EVENT.size <= len(self.buffer):
+            action_id, player, turn = EVENT.unpack_from(self.buffer, offset)
+            action = ACTIONS[action_id]
+            args_at = offset + EVENT.size
+            if action in CONTRACT_ACTIONS:
+                if args_at + savegame.CONTRACT.size > len(self.buffer):
+                    break
+                *_, n1, n2 = savegame.CONTRACT.unpack_from(self.buffer, args_at)
+                offset = args_at + savegame.CONTRACT.size + savegame.TERM.size * (n1 + n2)
+            else:
+                offset = args_at + (ARGS[action].size if action in ARGS else 0)
+            if offset > len(self.buffer):
+                break  ## Cut off mid-write, e.g. by a crash
+            events.append((action, player, turn, args_at))
+        return events
+
+    def _args(self, game: Game, action: str, offset: int):
+        if action in CONTRACT_ACTIONS:
+            return savegame.decode_contract(self.buffer, offset, game.factories)[:1]
+        if action == 'build':
+            return [savegame.BUILDING_TYPES[ARGS[action].unpack_from(self.buffer, offset)[0]]]
+        if action == 'add_ore':
+            resource, n = ARGS[action].unpack_from(self.buffer, offset)
+            return [RESOURCE_NAMES[resource], n]
+        if action in ARGS:
+            return list(ARGS[action].unpack_from(self.buffer, offset))
+        return []
+
+    def apply(self, game: Game, event: tuple):
+        action, player, turn, offset = event
+        args = self._args(game, action, offset)
+        if player != NO_PLAYER:
+            args.insert(0, game.factories[player])
+        getattr(game, action)(*args)
+
+    ## Replays events[start:] until the game reaches the given turn (None for the whole log)
+    def _run(self, game: Game, start: int, turn: int | None):
+        i = start
+        while i < len(self.events) and (turn is None or game.t < turn):
+            self.apply(game, self.events[i])
+            i += 1
+            last = self.checkpoints[-1][0] if self.checkpoints else 0
+            if game.t >= last + self.checkpoint_every:
+                self.checkpoints.append((game.t, i, savegame.dumps(game)))
+        return game
+
+    ## The game as it was at the start of the given turn, before anyone moved
+    ## Starts from the closest checkpoint, so seeking costs O(events since that checkpoint)
+    def game_at(self, turn: int):
+        k = bisect.bisect_right(self.checkpoints, turn, key=lambda c: c[0])
+        if k:
+            _, start, snapshot = self.checkpoints[k - 1]
+        else:
+            start, snapshot = 0, self.initial
+        return self._run(savegame.loads(snapshot).to_game(), start, turn)
+
+    def final(self):
+        start, snapshot = (self.checkpoints[-1][1:] if self.checkpoints else (0, self.initial))
+        return self._run(savegame.loads(snapshot).to_game(), start, None)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Replay an action log headless')
+    parser.add_argument('log')
+    parser.add_argument('--turn', type=int, help='show the state at the start of this turn (default: the end)')
+    parser.add_argument('--bench', type=int, metavar='N', help='time N full replays')
+    args = parser.parse_args()
+
+    replayer = Replayer.open(args.log)
+    game = replayer.final() if args.turn is None else replayer.game_at(args.turn)
+    print(f'{len(replayer.events)} events, seed {"unknown" if replayer.seed is None else replayer.seed}, '
+          f'showing turn {game.t}')
+    for f in game.factories:
+        status = 'out' if f not in game.players else f'blocked {f.blockedFromPlaying}' if f.blockedFromPlaying > 0 else ''
+        print(f'  {f.name:<8} score {f.score():>10.1f}  buildings {len(f.buildings):>3}  {status}')
+    if args.bench:
+        start = time.perf_counter()
+        for _ in range(args.bench):
+            Replayer(replayer.buffer).final()
+        elapsed = time.perf_counter() - start
+        print(f'{args.bench} replays in {elapsed:.3f}s, '
+              f'{args.bench * len(replayer.events) / elapsed:.0f} events/s')
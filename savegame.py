@@ -0,0 +1,182 @@
+## Compact binary snapshots of a Game, small and quick enough to write every turn
+## Loading memory-maps the file, and Snapshot.factory() / contracts() only decode the parts that get
+## asked for, e.g. to show one player's factory. to_game() needs all of it, so it decodes everything
+##
+## Layout (little-endian), version 2:
+##   header      magic 'SISG', version, counts, turn state and the offsets of the sections below
+##   factories   u32 offset per factory, then per factory:
+##                 capacity, blockedFromPlaying, flags (boosted/in play/killed), loadout, listed ores mask,
+##                 name, inventory (i64 milli-units per resource), buildings as (type, boosted) byte pairs
+##   contracts   per live contract: parties, deadline, then (amount, trade index) per term
+##   rng         random.getstate() of the game's rng: version, 625 words, gauss_next
+import mmap
+import os
+import random
+import struct
+
+import numpy as np
+
+from factoryMechanics import (
+    Factory, Contract, AMOUNT_DTYPE, BOOSTED_SLOT, BUILDING_KEYS, RESOURCE_CLASSES, RESOURCE_NAMES, N_RESOURCES, TRADE_POSSIBILITIES)
+from simulation import Game
+
+MAGIC = b'SISG'
+SAVE_VERSION = 2  ## 2: inventories went from float units to integer milli-units
+
+HEADER = struct.Struct('<4sHHHHIIBxxxIII')
+FACTORY = struct.Struct('<IiBcIBI')
+CONTRACT = struct.Struct('<HHIBB')
+TERM = struct.Struct('<iB')
+RNG = struct.Struct('<B625IBd')
+
+INVENTORY_DTYPE = np.dtype('<i8')
+BUILDING_TYPES = BUILDING_KEYS  ## The catalog's own list, so types defined later are included
+
+BOOSTED, IN_PLAY, KILLED = 1, 2, 4
+
+
+class SaveError(Exception):
+    pass
+
+
+def _encode_factory(game: Game, factory: Factory, loadout: str | None):
+    flags = (BOOSTED * factory.boosted | IN_PLAY * (factory in game.players)
+             | KILLED * (factory in game.killed))
+    name = factory.name.encode()
+    listed = sum(1 << ore.id for ore in factory.ores)
+    ## Slot codes are 2 * catalog index + boosted, and BUILDING_TYPES is in catalog order
+    buildings = bytes(b for code in factory.slots for b in (code >> 1, code & BOOSTED_SLOT))
+    return (FACTORY.pack(factory.capacity, factory.blockedFromPlaying, flags, (loadout or '-').encode(),
+                         listed, len(name), len(factory.buildings))
+            + name + factory.inventory.astype(INVENTORY_DTYPE).tobytes() + buildings)
+
+
+def encode_contract(factories: list[Factory], contract: Contract):
+    out = [CONTRACT.pack(factories.index(contract.party1), factories.index(contract.party2),
+                         contract.timeLimit, len(contract.terms1), len(contract.terms2))]
+    for n, t in contract.terms1 + contract.terms2:
+        out.append(TERM.pack(n, TRADE_POSSIBILITIES.index(t)))
+    return b''.join(out)
+
+
+## Returns the contract and the offset just past it
+def decode_contract(buffer, offset: int, factories: list[Factory]):
+    p1, p2, time_limit, n1, n2 = CONTRACT.unpack_from(buffer, offset)
+    offset += CONTRACT.size
+    terms = []
+    for _ in range(n1 + n2):
+        n, t = TERM.unpack_from(buffer, offset)
+        offset += TERM.size
+        terms.append((n, TRADE_POSSIBILITIES[t]))
+    return Contract(factories[p1], factories[p2], terms[:n1], terms[n1:], time_limit), offset
+
+
+def dumps(game: Game):
+    factories = game.factories
+    loadouts = game.loadouts or [None] * len(factories)
+    records = [_encode_factory(game, f, key) for f, key in zip(factories, loadouts)]
+    table = bytearray()
+    offset = HEADER.size + 4 * len(records)
+    for record in records:
+        table += struct.pack('<I', offset)
+        offset += len(record)
+    contracts = list(game.contracts)
+    contracts_off = offset
+    contract_bytes = b''.join(encode_contract(factories, c) for c in contracts)
+    rng_off = contracts_off + len(contract_bytes)
+    version, words, gauss = game.rng.getstate()
+    rng = RNG.pack(version, *words, gauss is not None, gauss or 0.0)
+    header = HEADER.pack(MAGIC, SAVE_VERSION, len(factories), N_RESOURCES, len(BUILDING_TYPES),
+                         game.t, game.max_turn, game.is_end, contracts_off, len(contracts), rng_off)
+    return b''.join([header, table, *records, contract_bytes, rng])
+
+
+## Writes to a temporary file first, so a crash mid-save never leaves a broken snapshot behind
+def save(game: Game, path: str | os.PathLike):
+    tmp = f'{os.fspath(path)}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(dumps(game))
+    os.replace(tmp, path)
+
+
+class Snapshot:
+    def __init__(self, buffer):
+        self.buffer = buffer
+        if len(buffer) < HEADER.size:
+            raise SaveError('File is too short to be a save')
+        (magic, version, n_factories, n_resources, n_building_types, self.t, self.max_turn, is_end,
+         self._contracts_off, self.n_contracts, self._rng_off) = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise SaveError('Not a save file')
+        if version != SAVE_VERSION:
+            raise SaveError(f'Save is version {version}, expected {SAVE_VERSION}')
+        if n_resources != N_RESOURCES or n_building_types != len(BUILDING_TYPES):
+            raise SaveError('Save was made with a different set of resources or buildings')
+        self.is_end = bool(is_end)
+        self.n_factories = n_factories
+        self._factories: list[tuple | None] = [None] * n_factories
+
+    ## Decoded on first access only
+    def factory(self, i: int):
+        if self._factories[i] is None:
+            (offset,) = struct.unpack_from('<I', self.buffer, HEADER.size + 4 * i)
+            capacity, blocked, flags, loadout, listed, name_len, n_buildings = FACTORY.unpack_from(self.buffer, offset)
+            offset += FACTORY.size
+            name = bytes(self.buffer[offset:offset + name_len]).decode()
+            offset += name_len
+            inventory = np.frombuffer(self.buffer, INVENTORY_DTYPE, N_RESOURCES, offset).astype(AMOUNT_DTYPE)
+            offset += INVENTORY_DTYPE.itemsize * N_RESOURCES
+            pairs = self.buffer[offset:offset + 2 * n_buildings]
+            ores = [RESOURCE_CLASSES[name](0) for i, name in enumerate(RESOURCE_NAMES) if listed >> i & 1]
+            factory = Factory(name, [], ores, capacity)
+            for type_id, boosted in zip(pairs[::2], pairs[1::2]):
+                factory.place(BUILDING_TYPES[type_id], bool(boosted))
+            factory.inventory[:] = inventory
+            factory.inventory_changed()
+            factory.blockedFromPlaying = blocked
+            factory.boosted = bool(flags & BOOSTED)
+            self._factories[i] = (factory, flags, loadout.decode())
+        return self._factories[i]
+
+    @property
+    def factories(self):
+        return [self.factory(i)[0] for i in range(self.n_factories)]
+
+    def contracts(self):
+        factories = self.factories
+        offset = self._contracts_off
+        for _ in range(self.n_contracts):
+            contract, offset = decode_contract(self.buffer, offset, factories)
+            yield contract
+
+    def rng_state(self):
+        version, *words, has_gauss, gauss = RNG.unpack_from(self.buffer, self._rng_off)
+        return version, tuple(words), gauss if has_gauss else None
+
+    ## The whole game, so every factory and contract gets decoded
+    def to_game(self):
+        decoded = [self.factory(i) for i in range(self.n_factories)]
+        loadouts = [loadout for _, _, loadout in decoded]
+        rng = random.Random()
+        rng.setstate(self.rng_state())
+        game = Game([f for f, _, _ in decoded], max_turn=self.max_turn, rng=rng,
+                    loadouts=None if '-' in loadouts else loadouts)
+        game.players = [f for f, flags, _ in decoded if flags & IN_PLAY]
+        game.killed = {f for f, flags, _ in decoded if flags & KILLED}
+        for contract in self.contracts():
+            game.add_contract(contract)
+        game.t = self.t
+        game.is_end = self.is_end
+        if game.is_end:
+            game.end()
+        return game
+
+
+def loads(data: bytes):
+    return Snapshot(memoryview(data))
+
+
+## The file stays mapped for as long as the snapshot is around, nothing is read until it's needed
+def load(path: str | os.PathLike):
+    with open(path, 'rb') as f:
+        return Snapshot(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
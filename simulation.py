@@ -0,0 +1,305 @@
+## Headless game engine, no pygame needed
+## Owns the turn order, mining cadence, blocked turns, contract deadlines and scoring,
+## so whole games can be played by scripts or bots (see play) as well as by ui.main
+import random
+from typing import Callable
+
+from factoryMechanics import (
+    Factory, Contract, ContractScheduler, Settlement, settle, FactoryBatch, MINE_CLASSES, BUYABLE_TYPES, BUILD_BITS,
+    RESOURCE_CLASSES)
+
+MAXTURN = 40
+
+## Loadouts as ui's demo_factory always dealt them: (starting buildings, starting ores, capacity)
+## These follow RuleBook.txt's table except A, which starts with 10 Copper where the RuleBook has 5
+LOADOUTS = {
+    "A": (["IronMine"], {"Copper": 10, "Iron": 30}, 10),
+    "B": (["CopperMineBasic"], {"Copper": 95}, 10),
+    "C": (["CopperMineAdvanced"], {"Copper": 5, "Iron": 15}, 10),
+    "D": (["IronMine"], {}, 12),
+    "E": (["CopperMineBasic"], {"Copper": 33, "Iron": 10}, 11),
+    "L": ([], {"DragonEgg": 1, "Elbaite": 1, "Yooperlite": 1, "FireOpal": 1}, 10),
+}
+LOADOUT_NAMES = {"A": "Industrialist", "B": "Copper Baron", "C": "Jumpstart", "D": "Architect",
+                 "E": "Specialist", "L": "Lucky Winner"}
+## A d1000 roll below the limit gets that loadout (if it's still free), 996 and up is Lucky Winner
+LOADOUT_ODDS = [(200, "A"), (399, "B"), (598, "C"), (797, "D"), (996, "E")]
+
+
+def make_loadout(key: str, name: str = 'name'):
+    buildings, ores, capacity = LOADOUTS[key]
+    return Factory(name, [MINE_CLASSES[b]() for b in buildings],
+                   [cls(ores.get(o, 0)) for o, cls in RESOURCE_CLASSES.items() if o != "NullResource"],
+                   capacity)
+
+
+## Each player gets a different loadout
+def draw_loadouts(rng: random.Random, n: int = 4):
+    if n > len(LOADOUTS):
+        raise ValueError(f'Only {len(LOADOUTS)} loadouts to go round, not {n}')
+    keys = []
+    while len(keys) < n:
+        luck = rng.randint(1, 1000)
+        for limit, key in LOADOUT_ODDS:
+            if luck < limit and key not in keys:
+                keys.append(key)
+                break
+        else:
+            if luck >= 996 and "L" not in keys:
+                keys.append("L")
+    return keys
+
+
+class Game:
+    def __init__(self, factories: list[Factory], max_turn: int = MAXTURN, rng: random.Random | None = None,
+                 loadouts: list[str] | None = None):
+        self.factories = list(factories)  # Everyone who started, in turn order
+        self.players = list(factories)  # Everyone still in the game
+        self.killed: set[Factory] = set()
+        self.contracts = ContractScheduler()
+        self.max_turn = max_turn
+        self.rng = rng or random.Random()
+        self.t = 0
+        self.is_end = False
+        self.scores: dict[Factory, float] = {}
+        self.ledger: list[Settlement] = []  ## How the contracts due on the last turn went
+        self.loadouts = loadouts
+        self.batch = FactoryBatch(self.factories)  ## Replaced by a shared one in play_batch
+        self.log = None  ## Anything with record(game, action, factory, *args), e.g. replay.ActionLog
+
+    @classmethod
+    def new(cls, rng: random.Random | None = None, n_players: int = 4, names: list[str] | None = None, **kwargs):
+        rng = rng or random.Random()
+        loadouts = draw_loadouts(rng, n_players)
+        names = names or [f'P{i+1}' for i in range(n_players)]
+        return cls([make_loadout(key, name) for key, name in zip(loadouts, names)], rng=rng,
+                   loadouts=loadouts, **kwargs)
+
+    @property
+    def current(self):
+        return self.players[self.t % len(self.players)]
+
+    def can_act(self, factory: Factory):
+        return not self.is_end and factory is self.current and factory.blockedFromPlaying <= 0
+
+    ## Dead players leave the turn order when their turn comes round, last one standing wins
+    def prune(self):
+        while self.current in self.killed and len(self.players) > 1:
+            self.contracts.drop_party(self.current)
+            self.players.remove(self.current)
+        if len(self.players) == 1 and not self.is_end:
+            self.end()
+
+    def end(self):
+        self.is_end = True
+        self.scores = {f: f.score() for f in self.players}
+
+    def _record(self, action: str, factory: Factory | None, *args):
+        if self.log is not None:
+            self.log.record(self, action, factory, *args)
+
+    ## Player actions, each one goes to the action log (if there is one) so games can be replayed
+    def build(self, factory: Factory, buildingType: str):
+        self._record('build', factory, buildingType)
+        factory.createBuilding(buildingType)
+
+    def boost(self, factory: Factory, buildingNumber: int):
+        self._record('boost', factory, buildingNumber)
+        factory.increaseProduction(buildingNumber)
+
+    def add_ore(self, factory: Factory, ore: str, n: int):
+        self._record('add_ore', factory, ore, n)
+        factory.add_ore(ore, n)
+
+    def petrify(self, factory: Factory):
+        self._record('petrify', factory)
+        factory.blockedFromPlaying = max(factory.blockedFromPlaying, 2)
+
+    def kill(self, factory: Factory):
+        self._record('kill', factory)
+        self.killed.add(factory)
+        self.prune()
+
+    ## Offers only get logged, nothing changes until the other side accepts (add_contract)
+    def propose(self, contract: Contract):
+        self._record('propose', None, contract)
+
+    def reject(self, contract: Contract):
+        self._record('reject', None, contract)
+
+    def add_contract(self, contract: Contract):
+        self._record('add_contract', None, contract)
+        self.contracts.add(contract)
+
+    def next_turn(self):
+        self._record('next_turn', None)
+        self._next_turn()
+
+    def _next_turn(self):
+        self._start_turn()
+        self.batch.mine()
+        self._finish_turn()
+
+    ## A turn is split around the mining so play_batch can mine every game's factories at once
+    def _start_turn(self):
+        self.t += 1
+        if self.t != self.max_turn and self.t % len(self.players) == 0:
+            ## Only mine once everyone has had a turn
+            self._owe(1)
+
+    def _finish_turn(self):
+        ## Settle every contract due this turn in one go
+        self.ledger = settle(self.contracts.pop_due(self.t), self.batch)
+
+        if self.t == self.max_turn:
+            self.end()
+        else:
+            self.prune()
+
+    ## Runs n collection cycles, blocked (and dead) players lose cycles instead of mining
+    def _mine(self, cycles: int):
+        self._owe(cycles)
+        self.batch.mine()
+
+    ## Books the cycles in self.batch.due, they get mined on the next batch.mine()
+    def _owe(self, cycles: int):
+        due, rows = self.batch.due, self.batch.rows
+        for f in self.players:
+            if f in self.killed:
+                f.blockedFromPlaying -= cycles
+                continue
+            skipped = min(max(f.blockedFromPlaying, 0), cycles)
+            f.blockedFromPlaying -= skipped
+            due[rows[f]] += cycles - skipped
+
+    ## Same as calling next_turn until the given turn, without anyone moving
+    ## Turns where nothing but mining happens are skipped over in one go, so this costs
+    ## O(contract deadlines + buildings) rather than O(turns * buildings)
+    def advance_to(self, turn: int):
+        self._record('advance_to', None, turn)
+        self._advance_to(turn)
+
+    def _advance_to(self, turn: int):
+        turn = min(turn, self.max_turn)
+        while self.t < turn and not self.is_end:
+            if self.killed.intersection(self.players):
+                ## Someone is about to leave the turn order, take it a turn at a time
+                self._next_turn()
+                continue
+            stop = min(turn, self.next_deadline())
+            n = len(self.players)
+            self._mine((stop - 1) // n - self.t // n)
+            self.t = stop - 1
+            self._next_turn()
+
+    def advance(self, turns: int):
+        self.advance_to(self.t + turns)
+
+    ## How many turns until someone who isn't blocked gets to play
+    def turns_until_unblocked(self):
+        blocked = [f.blockedFromPlaying for f in self.players]
+        n = len(self.players)
+        for t in range(self.t, self.max_turn):
+            if blocked[t % n] <= 0:
+                return t - self.t
+            if (t + 1) % n == 0:
+                blocked = [b - 1 if b > 0 else b for b in blocked]
+        return self.max_turn - self.t
+
+    def skip_blocked(self):
+        self._record('skip_blocked', None)
+        while not self.is_end and (turns := self.turns_until_unblocked()):
+            self._advance_to(self.t + turns)
+
+    def next_deadline(self):
+        deadline = self.contracts.next_deadline(self.t)
+        return self.max_turn if deadline is None else min(deadline, self.max_turn)
+
+    ## Plays until the end, policy(game, factory) makes the moves for whoever's turn it is
+    def play(self, policy: Callable[[Game, Factory], None]):
+        self.prune()
+        while not self.is_end:
+            if self.can_act(self.current):
+                policy(self, self.current)
+            self.next_turn()
+        return self.scores
+
+
+## Plays many games to the end in lockstep, the way Game.play plays one
+## Every factory of every game shares one FactoryBatch, so each turn's mining for all of them is a
+## single multiply-add rather than one per game. Returns each game's scores
+def play_batch(games: list[Game], policy: Callable[[Game, Factory], None]):
+    batch = FactoryBatch([f for game in games for f in game.factories])
+    for game in games:
+        game.batch = batch
+        game.prune()
+    live = [game for game in games if not game.is_end]
+    while live:
+        for game in live:
+            if game.can_act(game.current):
+                policy(game, game.current)
+            game._record('next_turn', None)
+            game._start_turn()
+        batch.mine()
+        for game in live:
+            game._finish_turn()
+        live = [game for game in live if not game.is_end]
+    return [game.scores for game in games]
+
+
+## Policies
+
+def idle_policy(game: Game, factory: Factory):
+    pass
+
+
+## What the factory can build right now, most expensive first (by what the cost is worth)
+def affordable_buildings(factory: Factory):
+    mask = factory.affordable
+    return [key for key in BUYABLE_TYPES if mask & BUILD_BITS[key]]
+
+
+## Boosts whatever it can, then buys the most expensive building it can afford until it can't
+def greedy_policy(game: Game, factory: Factory):
+    for i, building in enumerate(factory.buildings):
+        if not factory.can_boost():
+            break
+        if not building.boosted:
+            game.boost(factory, i)
+    while affordable := affordable_buildings(factory):
+        game.build(factory, affordable[0])
+
+
+## Buys random affordable buildings, and sometimes saves up instead, using the game's seeded rng
+def random_policy(game: Game, factory: Factory):
+    while len(factory.buildings) < factory.capacity and game.rng.random() < 0.7:
+        affordable = affordable_buildings(factory)
+        if not affordable:
+            return
+        game.build(factory, game.rng.choice(affordable))
+
+
+POLICIES = {"greedy": greedy_policy, "random": random_policy, "idle": idle_policy}
+
+
+## Plays a fixed list of moves, script maps turn -> [(action, *args)], e.g. {0: [("build", "IronMine")]}
+class ScriptedPolicy:
+    def __init__(self, script: dict[int, list[tuple]]):
+        self.script = script
+
+    def __call__(self, game: Game, factory: Factory):
+        for action, *args in self.script.get(game.t, []):
+            getattr(game, action)(factory, *args)
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rng = random.Random(0)
+    start = time.perf_counter()
+    for _ in range(n):
+        Game.new(rng).play(greedy_policy)
+    elapsed = time.perf_counter() - start
+    print(f'{n} games in {elapsed:.2f}s ({n / elapsed:.0f} games/s)')
@@ -0,0 +1,48 @@
+## Tests for the action log and replays (replay.ActionLog / Replayer)
+##   python -m pytest -q
+from replay import ActionLog, Replayer
+from simulation import greedy_policy
+from test_savegame import game_state, mid_game, play_turns
+
+
+## Plays the mid_game scenario to the end with a log, and keeps the live state at the start of every turn
+## Greedy, because the log only has actions: random_policy's own draws from game.rng aren't in it
+def logged_game(path):
+    states = {}
+
+    class Watcher(ActionLog):
+        def record(self, game, action, factory, *args):
+            states.setdefault(game.t, game_state(game))
+            super().record(game, action, factory, *args)
+
+    game = mid_game(lambda game: Watcher.create(path, game, 7), greedy_policy)
+    play_turns(game, 100, greedy_policy)
+    game.log.close()
+    return game, states
+
+
+def test_final_matches_live(tmp_path):
+    game, states = logged_game(tmp_path / 'game.sisl')
+    replayer = Replayer.open(tmp_path / 'game.sisl')
+    assert replayer.seed == 7
+    assert game_state(replayer.final()) == game_state(game)
+
+
+## Seeking from the start, then again once final() has left checkpoints behind, at and between them
+def test_game_at_matches_live(tmp_path):
+    game, states = logged_game(tmp_path / 'game.sisl')
+    replayer = Replayer.open(tmp_path / 'game.sisl', checkpoint_every=4)
+    for turn in (3, 11):
+        assert game_state(replayer.game_at(turn)) == states[turn]
+    replayer.final()
+    checkpointed = [turn for turn, _, _ in replayer.checkpoints]
+    assert len(checkpointed) > 2
+    for turn in sorted(set(checkpointed) | {checkpointed[0] + 1, checkpointed[1] + 2}):
+        if turn in states:
+            assert game_state(replayer.game_at(turn)) == states[turn]
+
+
+def test_seed_unknown(tmp_path):
+    game = mid_game(lambda game: ActionLog.create(tmp_path / 'resumed.sisl', game))
+    game.log.close()
+    assert Replayer.open(tmp_path / 'resumed.sisl').seed is None
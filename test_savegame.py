@@ -0,0 +1,90 @@
+## Round-trip tests for the binary save format (savegame.dumps / loads / Snapshot.to_game)
+##   python -m pytest -q
+import random
+
+from factoryMechanics import Contract
+from simulation import Game, random_policy
+import savegame
+
+
+## Everything a save is meant to keep, in a form that compares equal between two separate games
+def game_state(game: Game):
+    index = {f: i for i, f in enumerate(game.factories)}
+    factories = [(f.name, f.inventory.tolist(), list(f.slots), f.capacity, f.blockedFromPlaying, f.boosted,
+                  sorted(ore.type for ore in f.ores)) for f in game.factories]
+    contracts = sorted((index[c.party1], index[c.party2], c.terms1, c.terms2, c.timeLimit) for c in game.contracts)
+    return (factories, [index[f] for f in game.players], sorted(index[f] for f in game.killed), contracts,
+            game.t, game.max_turn, game.is_end, game.loadouts, game.rng.getstate())
+
+
+def play_turns(game: Game, turns: int, policy=random_policy):
+    for _ in range(turns):
+        if game.is_end:
+            return
+        if game.can_act(game.current):
+            policy(game, game.current)
+        game.next_turn()
+
+
+## A few turns in, with a boosted building, live contracts, a blocked player and one killed
+## (but not yet out of the turn order), so every part of the format has something in it
+def mid_game(log_to=None, policy=random_policy):
+    game = Game.new(random.Random(7))
+    if log_to is not None:
+        game.log = log_to(game)
+    a, b, c, d = game.factories
+    game.add_ore(a, 'FireOpal', 2)
+    game.boost(a, 0)
+    game.add_contract(Contract(a, b, [(5, 'Copper')], [(1, 'Increase slot')], 9))
+    game.add_contract(Contract(b, c, [(2, 'Iron')], [(3, 'Copper')], 30))
+    play_turns(game, 6, policy)
+    game.petrify(b)
+    game.kill(d)
+    play_turns(game, 5, policy)
+    return game
+
+
+def test_round_trip_mid_game():
+    game = mid_game()
+    assert len(game.contracts) and game.killed and not game.is_end
+    restored = savegame.loads(savegame.dumps(game)).to_game()
+    assert game_state(restored) == game_state(game)
+
+
+## Killed players stay in the turn order until their turn comes round
+def test_round_trip_killed_player_still_in_turn_order():
+    game = Game.new(random.Random(3))
+    game.kill(game.factories[2])
+    assert game.factories[2] in game.players
+    restored = savegame.loads(savegame.dumps(game)).to_game()
+    assert game_state(restored) == game_state(game)
+
+
+## The rng state came along too, so both copies play out the rest of the game the same way
+def test_restored_game_plays_on_the_same():
+    game = mid_game()
+    restored = savegame.loads(savegame.dumps(game)).to_game()
+    play_turns(game, 100)
+    play_turns(restored, 100)
+    assert game.is_end and restored.is_end
+    assert game_state(restored) == game_state(game)
+    assert [restored.scores.get(f) for f in restored.factories] == [game.scores.get(f) for f in game.factories]
+
+
+def test_round_trip_finished_game(tmp_path):
+    game = mid_game()
+    play_turns(game, 100)
+    savegame.save(game, tmp_path / 'end.sisg')
+    restored = savegame.load(tmp_path / 'end.sisg').to_game()
+    assert game_state(restored) == game_state(game)
+    assert restored.is_end and len(restored.scores) == len(game.scores)
+
+
+def test_factories_decode_on_their_own():
+    game = mid_game()
+    snapshot = savegame.loads(savegame.dumps(game))
+    factory, flags, loadout = snapshot.factory(2)
+    assert factory.name == game.factories[2].name
+    assert factory.inventory.tolist() == game.factories[2].inventory.tolist()
+    assert loadout == game.loadouts[2]
+    assert snapshot._factories[0] is None
@@ -0,0 +1,86 @@
+## Regression tests for contract settlement (factoryMechanics.clear / settle)
+##   python -m pytest -q
+from factoryMechanics import Factory, FactoryBatch, Contract, Copper, Iron, settle, clear, to_milli, RESOURCE_IDS
+
+
+def make(name: str, copper: int = 0, iron: int = 0, capacity: int = 10):
+    return Factory(name, [], [Copper(copper), Iron(iron)], capacity)
+
+
+def held(factory: Factory, ore: str):
+    return int(factory.inventory[RESOURCE_IDS[ore]])
+
+
+def test_nothing_due():
+    assert settle([]) == []
+    clearing = clear([])
+    assert clearing.parties == [] and clearing.ledger == [] and clearing.insolvent == []
+
+
+## A pays B, B pays C, C pays A: it all nets out, so nobody needs to hold anything
+def test_cycle_clears_with_nothing_held():
+    a, b, c = make('A'), make('B'), make('C')
+    ledger = settle([Contract(a, b, [(5, 'Copper')], [], 1),
+                     Contract(b, c, [(5, 'Copper')], [], 1),
+                     Contract(c, a, [(5, 'Copper')], [], 1)])
+    assert all(s.fulfilled and not s.defaulted for s in ledger)
+    assert [held(f, 'Copper') for f in (a, b, c)] == [0, 0, 0]
+    assert [f.blockedFromPlaying for f in (a, b, c)] == [0, 0, 0]
+
+
+def test_net_position_moves():
+    a, b = make('A', copper=10), make('B', iron=4)
+    (s,) = settle([Contract(a, b, [(10, 'Copper')], [(4, 'Iron')], 1)])
+    assert s.fulfilled
+    assert (held(a, 'Copper'), held(a, 'Iron')) == (0, to_milli(4))
+    assert (held(b, 'Copper'), held(b, 'Iron')) == (to_milli(10), 0)
+
+
+## A can't pay B, so B can't pay C out of what A would have sent: both contracts fall through,
+## nothing moves, and both A and B get blocked
+def test_default_cascades():
+    a, b, c = make('A', copper=10), make('B'), make('C')
+    first = Contract(a, b, [(10, 'Copper'), (5, 'Iron')], [], 1)
+    second = Contract(b, c, [(10, 'Copper')], [], 1)
+    ledger = settle([second, first])
+    assert [(s.fulfilled, s.defaulted) for s in ledger] == [(False, [b]), (False, [a])]
+    assert [held(f, 'Copper') for f in (a, b, c)] == [to_milli(10), 0, 0]
+    assert [f.blockedFromPlaying for f in (a, b, c)] == [3, 3, 0]
+
+
+## Someone defaulting elsewhere doesn't stop an unrelated contract
+def test_default_leaves_others_alone():
+    a, b, c, d = make('A'), make('B'), make('C', copper=3), make('D')
+    bad, good = Contract(a, b, [(1, 'Iron')], [], 1), Contract(c, d, [(3, 'Copper')], [], 1)
+    ledger = settle([bad, good])
+    assert [s.fulfilled for s in ledger] == [False, True]
+    assert held(d, 'Copper') == to_milli(3)
+    assert c.blockedFromPlaying == 0
+
+
+## Factories in a batch get their net positions in one go, with the same result
+def test_batch_settles_in_place():
+    a, b, c = make('A', copper=10), make('B', iron=4), make('C')
+    batch = FactoryBatch([a, b, c])
+    (s,) = settle([Contract(a, b, [(10, 'Copper')], [(4, 'Iron')], 1)], batch)
+    assert s.fulfilled
+    assert batch.inventory[:, [RESOURCE_IDS['Copper'], RESOURCE_IDS['Iron']]].tolist() == [
+        [0, to_milli(4)], [to_milli(10), 0], [0, 0]]
+    assert held(b, 'Copper') == to_milli(10) and b.can_buy('CopperMineBasic')
+
+
+def test_slot_terms_move_capacity():
+    a, b = make('A', capacity=10), make('B', copper=3, capacity=10)
+    (s,) = settle([Contract(a, b, [(2, 'Increase slot')], [(3, 'Copper')], 1)])
+    assert s.fulfilled
+    assert (a.capacity, b.capacity) == (8, 12)
+    assert held(a, 'Copper') == to_milli(3)
+
+
+## Giving away your last slot is a default
+def test_slot_terms_need_a_slot_left():
+    a, b = make('A', capacity=1), make('B', copper=3)
+    (s,) = settle([Contract(a, b, [(1, 'Increase slot')], [(3, 'Copper')], 1)])
+    assert not s.fulfilled and s.defaulted == [a]
+    assert (a.capacity, b.capacity) == (1, 10)
+    assert held(b, 'Copper') == to_milli(3)
@@ -0,0 +1,161 @@
+## Monte Carlo tournament for checking loadout balance
+## Plays lots of seeded headless games over a process pool and streams per-loadout score stats
+## (one JSON line per finished chunk) so long runs can be watched or cut short
+##   python tournament.py --games 1000000 --out tournament.jsonl
+import argparse
+import bisect
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+import simulation
+
+LOADOUT_KEYS = list(simulation.LOADOUTS)
+## Scores span a few orders of magnitude, so bin them by log10(score + 1)
+HIST_BINS = np.linspace(0, 8, 161)
+_HIST_EDGES = HIST_BINS.tolist()
+
+
+## Every game gets its own seed, so results don't depend on chunking or worker count
+def game_seed(seed: int, i: int):
+    return (seed << 40) + i
+
+
+## Aggregates for a batch of games, one row per loadout
+## Small numpy arrays are all that goes back over the pipe, never Factory objects
+class Tally:
+    def __init__(self):
+        k = len(LOADOUT_KEYS)
+        self.games = 0
+        self.n = np.zeros(k, dtype=np.int64)
+        self.wins = np.zeros(k, dtype=np.int64)
+        self.total = np.zeros(k)
+        self.total_sq = np.zeros(k)
+        self.lo = np.full(k, np.inf)
+        self.hi = np.full(k, -np.inf)
+        self.hist = np.zeros((k, len(HIST_BINS) - 1), dtype=np.int64)
+
+    def add_game(self, loadouts: list[str], scores: list[float]):
+        self.games += 1
+        best = max(scores)
+        for key, score in zip(loadouts, scores):
+            i = LOADOUT_KEYS.index(key)
+            self.n[i] += 1
+            self.wins[i] += score == best
+            self.total[i] += score
+            self.total_sq[i] += score * score
+            self.lo[i] = min(self.lo[i], score)
+            self.hi[i] = max(self.hi[i], score)
+            self.hist[i, min(bisect.bisect_right(_HIST_EDGES, math.log10(score + 1)) - 1,
+                             len(_HIST_EDGES) - 2)] += 1
+
+    def merge(self, other: Tally):
+        self.games += other.games
+        self.n += other.n
+        self.wins += other.wins
+        self.total += other.total
+        self.total_sq += other.total_sq
+        self.lo = np.minimum(self.lo, other.lo)
+        self.hi = np.maximum(self.hi, other.hi)
+        self.hist += other.hist
+
+    ## q-th quantile, interpolated (in log space) inside the histogram bin that holds it
+    ## Clipped to the recorded min and max, which are exact where the bins aren't
+    def quantile(self, i: int, q: float):
+        cum = np.cumsum(self.hist[i])
+        target = q * cum[-1]
+        b = int(np.searchsorted(cum, target))
+        before = cum[b - 1] if b else 0
+        frac = (target - before) / self.hist[i, b]
+        log_score = HIST_BINS[b] + frac * (HIST_BINS[b + 1] - HIST_BINS[b])
+        return float(np.clip(10 ** log_score - 1, self.lo[i], self.hi[i]))
+
+    def summary(self, with_hist: bool = False):
+        out = {}
+        for i, key in enumerate(LOADOUT_KEYS):
+            n = int(self.n[i])
+            if not n:
+                continue
+            mean = float(self.total[i] / n)
+            out[key] = {
+                'n': n,
+                'win_rate': float(self.wins[i] / n),
+                'mean': mean,
+                'std': math.sqrt(max(float(self.total_sq[i] / n) - mean * mean, 0)),
+                'min': float(self.lo[i]),
+                'p10': self.quantile(i, 0.1),
+                'p50': self.quantile(i, 0.5),
+                'p90': self.quantile(i, 0.9),
+                'max': float(self.hi[i]),
+            }
+            if with_hist:
+                out[key]['hist'] = self.hist[i].tolist()
+        return out
+
+
+def play_chunk(job: tuple[int, int, int, str]):
+    seed, start, count, policy_name = job
+    policy = simulation.POLICIES[policy_name]
+    tally = Tally()
+    ## The whole chunk plays in lockstep, so each turn's mining is one numpy call for all of it
+    games = [simulation.Game.new(random.Random(game_seed(seed, i))) for i in range(start, start + count)]
+    for game, scores in zip(games, simulation.play_batch(games, policy)):
+        tally.add_game(game.loadouts, [scores.get(f, 0) for f in game.factories])
+    return tally
+
+
+def run(games: int, workers: int, chunk: int, seed: int, policy: str, out):
+    jobs = [(seed, start, min(chunk, games - start), policy) for start in range(0, games, chunk)]
+    total = Tally()
+    began = time.perf_counter()
+    ## Workers only need the engine, preloading it keeps their start-up cheap
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context('forkserver')
+        ctx.set_forkserver_preload(['simulation', 'numpy'])
+    else:
+        ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(workers) as pool:
+        for tally in pool.imap_unordered(play_chunk, jobs):
+            total.merge(tally)
+            elapsed = time.perf_counter() - began
+            record = {'games': total.games, 'elapsed': round(elapsed, 3),
+                      'games_per_s': round(total.games / elapsed), 'loadouts': total.summary()}
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+    out.write(json.dumps({'final': True, 'games': total.games, 'seed': seed, 'policy': policy,
+                          'loadouts': total.summary(with_hist=True),
+                          'hist_bins_log10': [round(b, 3) for b in _HIST_EDGES]}) + '\n')
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play lots of headless games and report score stats per loadout')
+    parser.add_argument('--games', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk', type=int, default=2000, help='games per job sent to a worker')
+    parser.add_argument('--seed', type=int, default=0)
+    ## greedy plays every loadout the same way every time, so it only tells you win rates,
+    ## random gives actual score distributions
+    parser.add_argument('--policy', choices=list(simulation.POLICIES), default='random')
+    parser.add_argument('--out', default='-', help='JSON lines output, - for stdout')
+    args = parser.parse_args()
+
+    out = sys.stdout if args.out == '-' else open(args.out, 'w')
+    try:
+        total = run(args.games, args.workers, args.chunk, args.seed, args.policy, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    for key, stats in total.summary().items():
+        print(f'{key} {simulation.LOADOUT_NAMES[key]:<14} n={stats["n"]:<8} win={stats["win_rate"]:6.1%} '
+              f'mean={stats["mean"]:10.1f} p50={stats["p50"]:10.1f}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ import functools
 from pathlib import Path
 from typing import Callable
 import random
+import time
 
 import pygame
 from pygame import Vector2 as Vec2, Color
@@ -10,19 +11,29 @@ from pygame import FRect, Rect as IRect
 
 import factoryMechanics as backend
 from factoryMechanics import (
-    Factory, CopperMineBasic, CopperMineAdvanced, IronMine, Copper, Iron, DragonEgg, FireOpal, Elbaite, Yooperlite, Tantalum, Titanium,
-    Building, Contract, NullResource)
+    Factory, DragonEgg, Elbaite, Yooperlite, Building, Contract, ContractScheduler, format_amount)
+import savegame
+import simulation
+from simulation import Game
+from replay import ActionLog
+from profiler import FrameProfiler
 
 ORE_TEXT_COLOR = 'white'
+AUTOSAVE = 'autosave.sisg'
 BUILDING_TEXT_COLOR = 'white'
 
+## Every named region of the window, worked out once per window size
 class ScreenInfo:
     def from_sc_size(self, sc_size: Vec2):
+        if getattr(self, 'sc_size', None) == sc_size:
+            return self
         self.sc_size = sc_size
         self.sc_rect = IRect((0, 0), sc_size)
         self.top_area = self.sc_rect.move_to(height=40, topleft=(0,0))
         self.turnCount_area = self.top_area.scale_by(0.5, 1).move_to(topleft=self.top_area.topleft)
         self.next_turn_area = self.top_area.scale_by(0.5, 1).move_to(topright=self.top_area.topright)
+        self.next_turn_short_area = self.next_turn_area.scale_by(0.5, 1).move_to(topleft=self.next_turn_area.topleft)
+        self.skip_blocked_area = self.next_turn_area.scale_by(0.5, 1).move_to(topright=self.next_turn_area.topright)
         self.rem_area = self.sc_rect.move_to(height=self.sc_rect.height-self.turnCount_area.height, bottom=self.sc_rect.bottom)
         self.main_area = self.rem_area.scale_by(1, 0.95).move_to(topleft=self.turnCount_area.bottomleft)
         self.menu_area = self.rem_area.scale_by(1, 0.05).move_to(topleft=self.main_area.bottomleft)
@@ -49,6 +60,34 @@ class ScreenInfo:
         self.contract_new_area = self.base_player_area.scale_by(1, 0.15).move_to(
             bottomleft=self.base_player_area.bottomleft)
         self.overlay_area = self.sc_rect.scale_by(0.9, 0.9)  # smae cetner?
+        ## Contract overlay, relative to overlay_area
+        self.overlay_main_section_rel = self.overlay_area.scale_by(1, 0.75).move_to(topleft=(0, 0))
+        self.overlay_deadline_container_rel = self.overlay_area.scale_by(1, 0.1).move_to(
+            topleft=self.overlay_main_section_rel.bottomleft)
+        self.overlay_deadline_intro_rel = self.overlay_deadline_container_rel.scale_by(0.5, 1).move_to(
+            topleft=self.overlay_deadline_container_rel.topleft)
+        self.overlay_deadline_main_rel = self.overlay_deadline_container_rel.scale_by(0.5, 1).move_to(
+            topleft=self.overlay_deadline_intro_rel.topright)
+        self.overlay_bot_section_rel = self.overlay_area.scale_by(1, 0.15).move_to(
+            topleft=self.overlay_deadline_container_rel.bottomleft)
+        self.overlay_cancel_button_rel = self.overlay_bot_section_rel.scale_by(0.5, 1).move_to(
+            topleft=self.overlay_bot_section_rel.topleft)
+        self.overlay_send_button_rel = self.overlay_bot_section_rel.scale_by(0.5, 1).move_to(
+            topright=self.overlay_bot_section_rel.topright)
+        self.overlay_left_main_rel = self.overlay_main_section_rel.scale_by(0.5, 1).move_to(
+            topleft=self.overlay_main_section_rel.topleft)
+        self.overlay_right_main_rel = self.overlay_main_section_rel.scale_by(0.5, 1).move_to(
+            topright=self.overlay_main_section_rel.topright)
+        ## Moves a button on the right-hand side of the overlay into overlay coordinates
+        self.overlay_texas_offset = (Vec2(self.overlay_right_main_rel.topleft)
+                                     - Vec2(self.overlay_main_section_rel.topleft))
+        ## Red, Yellow, Green, Blue
+        self.player_areas = [
+            self.base_player_area,
+            self.base_player_area.move(self.main_area.w / 2, 0),
+            self.base_player_area.move(0, self.main_area.h / 2),
+            self.base_player_area.move(Vec2(self.main_area.size) / 2),
+        ]
         return self
 
 
@@ -95,86 +134,236 @@ def load_from_fontspec(*fontspec: str, size=20, align: int = pygame.FONT_LEFT,
     return f
 
 
-def render_emptySlot():
-    dest = pygame.Surface((40, 40))
-    pygame.draw.rect(dest, 'black', IRect(0, 0, 40, 40))
+TEXT_CACHE_SIZE = 1024
+
+
+@functools.lru_cache(maxsize=TEXT_CACHE_SIZE)
+def _render_text(text: str, color, fontspec: tuple[str, ...], size: int, align: int, wraplength: int,
+                 strikethrough: bool, bold: bool):
+    font = load_from_fontspec(*fontspec, size=size, align=align, strikethrough=strikethrough, bold=bold)
+    return font.render(text, True, color, wraplength=wraplength)
+
+
+## Cached font.render, the surface returned is shared so never draw onto it
+## text_cache_info() has the hit/miss counts
+def render_text(text: str, color, *fontspec: str, size=20, align: int = pygame.FONT_LEFT, wraplength: int = 0,
+                strikethrough: bool = False, bold: bool = False) -> pygame.Surface:
+    if isinstance(color, pygame.Color):
+        color = tuple(color)  # Color isn't hashable
+    return _render_text(text, color, fontspec, size, align, wraplength, strikethrough, bold)
+
+
+text_cache_info = _render_text.cache_info
+
+
+## A contract as its `side` sees it, contracts don't change once they've been agreed to
+@functools.lru_cache(maxsize=1024)
+def render_contract_card(c: Contract, side: int, wraplength: int):
+    if side == 2:
+        c = c.op()
+    tex = load_from_fontspec('Helvetica', 'sans-serif').render(c.to_string(), True, 'white', wraplength=wraplength)
+    tex = tex.subsurface(tex.get_bounding_rect())
+    dest = pygame.Surface(tex.get_rect().size + Vec2(6, 6))
+    pygame.draw.rect(dest, pygame.Color(50, 50, 50), dest.get_rect())
+    dest.blit(tex, tex.get_rect(center=dest.get_rect().center))
     return dest
 
 
+## Big text with a blurred drop shadow, as (shadow, text). Blurring is slow, so each one
+## is only made once per text and panel width
+@functools.lru_cache(maxsize=32)
+def render_banner(text: str, width: int):
+    font = load_from_fontspec('Helvetica', 'sans-serif', bold=True, align=pygame.FONT_CENTER, size=100)
+    tex = font.render(text, True, (200,) * 3 + (200,), wraplength=width - 8)
+    tex_shadow = font.render(text, True, 'black', wraplength=width - 8)
+    tex_shadow_c = pygame.Surface(Vec2(tex_shadow.size) + (10, 10), pygame.SRCALPHA)
+    tex_shadow_c.blit(tex_shadow, tex_shadow.get_rect(center=tex_shadow_c.get_rect().center))
+    return pygame.transform.box_blur(tex_shadow_c, 5), tex
+
+
+def show_banner(dest: pygame.Surface, text: str):
+    for tex in render_banner(text, dest.width):
+        dest.blit(tex, tex.get_rect(center=dest.get_rect().center))
+
+
+## Uniform grid of buttons, so finding what was clicked only looks at the buttons near the click
+class HitGrid:
+    CELL = 64
+
+    def __init__(self, buttons: list[tuple[IRect, Callable, tuple]] = ()):
+        self.buttons = list(buttons)
+        self.cells: dict[tuple[int, int], list[int]] = {}
+        for i, (rect, _action, _args) in enumerate(self.buttons):
+            for cx in range(rect.left // self.CELL, (rect.right - 1) // self.CELL + 1):
+                for cy in range(rect.top // self.CELL, (rect.bottom - 1) // self.CELL + 1):
+                    self.cells.setdefault((cx, cy), []).append(i)
+
+    ## First button (in the order they were added) under pos, or None
+    def find(self, pos: Vec2):
+        x, y = int(pos[0]), int(pos[1])
+        for i in self.cells.get((x // self.CELL, y // self.CELL), ()):
+            if self.buttons[i][0].collidepoint(x, y):
+                return self.buttons[i]
+        return None
+
+
+NO_HITS = HitGrid()
+
+
+## Buttons are (rect, action, args) and are only collected again when the component's key changes,
+## between begin_buttons and end_buttons; the rest of the time add_button does nothing
+class Clickable:
+    hits: HitGrid = NO_HITS
+    _hits_key = None
+    _collecting = False
+
+    def begin_buttons(self, key):
+        self._collecting = key != self._hits_key
+        if self._collecting:
+            self._hits_key = key
+            self.buttons: list[tuple[IRect, Callable, tuple]] = []
+
+    def add_button(self, rect: IRect, action: Callable, *args):
+        if self._collecting:
+            self.buttons.append((IRect(rect), action, args))
+
+    def end_buttons(self):
+        if self._collecting:
+            self.hits = HitGrid(self.buttons)
+            self._collecting = False
+
+    def onclick(self, pos: Vec2):
+        print(f'Recv {type(self).__name__}.onclick')
+        button = self.hits.find(pos)
+        if button is None:
+            print(pos, [r for r, _action, _args in self.hits.buttons])
+            return
+        _, action, args = button
+        action(*args)
+
+
+TILE_SIZE = 40
+BOOSTED_MARK_COLOR = (255, 200, 40)
+
+
+def render_building(dest: pygame.Surface, cls: type[Building], boosted: bool, selectable: bool):
+    pygame.draw.rect(dest, cls.produces(0).colour, dest.get_rect())
+    if boosted:
+        pygame.draw.polygon(dest, BOOSTED_MARK_COLOR, [(TILE_SIZE - 10, 0), (TILE_SIZE - 1, 0), (TILE_SIZE - 1, 9)])
+    if selectable:
+        pygame.draw.rect(dest, 'white', dest.get_rect(), width=1)
+    tex = render_text(cls.get_abbreviation(), BUILDING_TEXT_COLOR, 'Helvetica', 'sans-serif')
+    dest.blit(tex, tex.get_rect(center=dest.get_rect().center))
+
+
+## Every building tile drawn once up front: one row per building class with a column for each
+## (boosted, selectable) combination, plus an empty slot at the end
+## Returns the atlas and {(class, boosted, selectable) or None for empty: area in the atlas}
+def building_atlas():
+    return _building_atlas(len(backend.MINE_CLASSES))
+
+
+## Cached per number of types, so one added with define_building gets a row too
+@functools.cache
+def _building_atlas(n_types: int):
+    variants = [(False, False), (True, False), (False, True), (True, True)]
+    atlas = pygame.Surface((TILE_SIZE * len(variants), TILE_SIZE * (len(backend.MINE_CLASSES) + 1)))
+    tiles: dict[tuple[type[Building], bool, bool] | None, IRect] = {}
+    for row, cls in enumerate(backend.MINE_CLASSES.values()):
+        for col, (boosted, selectable) in enumerate(variants):
+            area = IRect(col * TILE_SIZE, row * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+            render_building(atlas.subsurface(area), cls, boosted, selectable)
+            tiles[cls, boosted, selectable] = area
+    tiles[None] = IRect(0, len(backend.MINE_CLASSES) * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+    atlas.fill('black', tiles[None])
+    return atlas, tiles
+
+
 @dataclasses.dataclass
 class State:
     curr_player: Player = None
     creating_contract: Factory | None = None
     req_next_turn: bool = False
+    req_skip_blocked: bool = False
     req_boosting: bool = False
     is_end: bool = False
     players: list[Player] = None
+    game: Game = None
 
 
 @dataclasses.dataclass
-class Player:
+class Player(Clickable):
     color: pygame.Color
     factory: Factory
     area_getter: Callable[[], IRect]
-    all_contracts: list[Contract]
+    all_contracts: ContractScheduler
     state: State
     incoming_contracts: list[Contract] = dataclasses.field(default_factory=list)
     dead: bool = False
+    building_scroll: int = 0  # First row of building slots on show
+    contract_scroll: int = 0  # Likewise for rows of contracts
+    ## Retained panel: only the sections whose key changed since last frame get redrawn (see render_area)
+    _panel: pygame.Surface | None = dataclasses.field(default=None, init=False, repr=False, compare=False)
+    _panel_keys: dict[str, tuple] = dataclasses.field(default_factory=dict, init=False, repr=False, compare=False)
+    _panel_buttons: dict[str, list] = dataclasses.field(default_factory=dict, init=False, repr=False, compare=False)
+    _panel_hits: HitGrid | None = dataclasses.field(default=None, init=False, repr=False, compare=False)
+    _contract_layout: tuple | None = dataclasses.field(default=None, init=False, repr=False, compare=False)
 
     def kill(self):
         self.dead = True
-
-    def begin(self):
-        self.buttons: list[tuple[IRect, Callable[[], None]]] = []
+        self.state.game.kill(self.factory)
 
     @property
     def area(self):
         return self.area_getter()
 
-    def render_building(self, b: Building):
-        dest = pygame.Surface((40, 40))
-        pygame.draw.rect(dest, b.ore.colour, IRect(0, 0, 40, 40))
-        if self.state.req_boosting and self.state.curr_player is self:
-            pygame.draw.rect(dest, 'white', IRect(0, 0, 40, 40), width=1)
-        font = load_from_fontspec('Helvetica', 'sans-serif')
-        tex = font.render(b.get_abbreviation(), True, BUILDING_TEXT_COLOR)
-        tex_area = tex.get_rect(center=dest.get_rect().center)
-        dest.blit(tex, tex_area)
-        return dest
-
+    ## Only the rows that fit are drawn (and get boost buttons), starting from self.building_scroll,
+    ## so a factory with hundreds of slots costs the same as a small one
     def render_factories(self, dest: pygame.Surface):
-        x = 5
-        y = 5
-        h_max = 1
-        for i in range(self.factory.capacity):
-            if i < len(self.factory.buildings): 
-                tex = self.render_building(self.factory.buildings[i])
+        atlas, tiles = building_atlas()
+        selectable = self.state.req_boosting and self.state.curr_player is self
+        buildings = self.factory.buildings
+        step = TILE_SIZE + 5
+        cols, visible_rows, rows = self._building_grid(dest.size)
+        first = self.building_scroll * cols
+        for i in range(first, min(first + visible_rows * cols, self.factory.capacity)):
+            if i < len(buildings):
+                slot = buildings[i]
+                tile = tiles[slot.kind.cls, slot.boosted, selectable]
             else:
-                tex = render_emptySlot()
-            w, h = tex.size
-            if x + w > dest.width:
-                x = 5
-                y += h_max + 5  # Next 'line'
-                h_max = 1
-            txx = dest.blit(tex, (x, y))
-            if self.state.req_boosting and i < len(self.factory.buildings):
-                self.buttons += [
-                    (txx.move(SC_INFO.player_buildings_area.topleft),
-                     lambda i=i: self.boost_machine(i))]
-            x += w + 5
-            h_max = max(h_max, h)
+                tile = tiles[None]
+            row, col = divmod(i - first, cols)
+            txx = dest.blit(atlas, (5 + col * step, 5 + row * step), tile)
+            if self.state.req_boosting and i < len(buildings):
+                self.add_button(txx.move(SC_INFO.player_buildings_area.topleft), self.boost_machine, i)
+        if rows > visible_rows:
+            ## Scrollbar
+            h = dest.height * visible_rows // rows
+            top = (dest.height - h) * self.building_scroll // (rows - visible_rows)
+            pygame.draw.rect(dest, (200, 200, 200), IRect(dest.width - 4, top, 3, h))
+
+    ## (columns, rows that fit, rows needed) for the building grid, also keeps the scroll in range
+    def _building_grid(self, size: tuple[int, int]):
+        step = TILE_SIZE + 5
+        cols = max((size[0] - 5) // step, 1)
+        visible_rows = max((size[1] - 5) // step, 1)
+        rows = -(-self.factory.capacity // cols)
+        self.building_scroll = max(min(self.building_scroll, rows - visible_rows), 0)
+        return cols, visible_rows, rows
+
+    def scroll_buildings(self, rows: int):
+        self.building_scroll = max(self.building_scroll + rows, 0)
 
     def boost_machine(self, mach_idx: int):
         print(f'Boosting {mach_idx}...')
-        self.factory.increaseProduction(mach_idx)
+        self.state.game.boost(self.factory, mach_idx)
         self.state.req_boosting = False
 
     def render_ores(self, dest: pygame.Surface):
-        ores = sorted(self.factory.ores, key=lambda i: [*backend.RESOURCE_CLASSES].index(i.type))
-        font = load_from_fontspec('Helvetica', 'sans-serif')
-        text = '\n'.join(f'{o.type}: {round(o.amount, 3)}' for o in ores)
+        ores = sorted(self.factory.ores, key=lambda i: i.id)
+        text = '\n'.join(f'{o.type}: {format_amount(o.milli)}' for o in ores)
 
-        rendered = font.render(text, antialias=True, color=ORE_TEXT_COLOR,
+        rendered = render_text(text, ORE_TEXT_COLOR, 'Helvetica', 'sans-serif',
                                wraplength=dest.width - 5)  # 2, 3
         dest.blit(rendered, (3, 2))  # Padding: 2 above, 3 left
 
@@ -182,219 +371,196 @@ class Player:
         y = SC_INFO.player_buttons_area.top + 5
         # x = SC_INFO.player_buttons_area.left + 5
         w = SC_INFO.player_buttons_area.width
-        tex = load_from_fontspec('Helvetica', 'sans-serif').render(
-            'Petrify', True, 'white'
-        )
+        tex = render_text('Petrify', 'white', 'Helvetica', 'sans-serif')
         txr = tex.get_rect(top=y, centerx=SC_INFO.player_buttons_area.centerx)
         txx = pygame.draw.rect(dest, Color(50, 50, 50), txr.move_to(
             width=w-10, height=tex.height + 6, center=txr.center))
         dest.blit(tex, txr)
         y = txx.bottom + 5
-        self.buttons += [(txx, self.petrify_action)]
+        self.add_button(txx, self.petrify_action)
 
-        # TODO: disable if no fire opal !!!!!
-        has_opal = self.factory.can_buy_cost([(1, 'FireOpal')])
+        has_opal = self.factory.can_boost()
         text_color = 'white' if has_opal else (120, 120, 120)
         rect_color = ((50,) if has_opal else (68,)) * 3
-        tex = load_from_fontspec('Helvetica', 'sans-serif').render(
-            'Boost Machine', True, text_color
-        )
+        tex = render_text('Boost Machine', text_color, 'Helvetica', 'sans-serif')
         txr = tex.get_rect(top=y, centerx=SC_INFO.player_buttons_area.centerx)
         txx = pygame.draw.rect(dest, rect_color, txr.move_to(
             width=w - 10, height=tex.height + 6, center=txr.center))
         dest.blit(tex, txr)
         y = txx.bottom + 5
         if has_opal:
-            self.buttons += [(txx, self.use_fireopal_action)]
+            self.add_button(txx, self.use_fireopal_action)
 
-        tex = load_from_fontspec('Helvetica', 'sans-serif').render(
-            'Add FireOpal', True, 'white'
-        )
+        tex = render_text('Add FireOpal', 'white', 'Helvetica', 'sans-serif')
         txr = tex.get_rect(top=y, centerx=SC_INFO.player_buttons_area.centerx)
         txx = pygame.draw.rect(dest, Color(50, 50, 50), txr.move_to(
             width=w - 10, height=tex.height + 6, center=txr.center))
         dest.blit(tex, txr)
         y = txx.bottom + 5
-        self.buttons += [(txx, lambda: self.factory.add_ore("FireOpal", 1))]
+        self.add_button(txx, self.add_ore_action, "FireOpal")
 
-        tex = load_from_fontspec('Helvetica', 'sans-serif').render(
-            'Add Yooperlite', True, 'white'
-        )
+        tex = render_text('Add Yooperlite', 'white', 'Helvetica', 'sans-serif')
         txr = tex.get_rect(top=y, centerx=SC_INFO.player_buttons_area.centerx)
         txx = pygame.draw.rect(dest, Color(50, 50, 50), txr.move_to(
             width=w - 10, height=tex.height + 6, center=txr.center))
         dest.blit(tex, txr)
         y = txx.bottom + 5
-        self.buttons += [(txx, lambda: self.factory.add_ore(Yooperlite.name, 1))]
+        self.add_button(txx, self.add_ore_action, Yooperlite.name)
 
-        tex = load_from_fontspec('Helvetica', 'sans-serif').render(
-            'Add DragonEgg', True, 'white'
-        )
+        tex = render_text('Add DragonEgg', 'white', 'Helvetica', 'sans-serif')
         txr = tex.get_rect(top=y, centerx=SC_INFO.player_buttons_area.centerx)
         txx = pygame.draw.rect(dest, Color(50, 50, 50), txr.move_to(
             width=w - 10, height=tex.height + 6, center=txr.center))
         dest.blit(tex, txr)
         y = txx.bottom + 5
-        self.buttons += [(txx, lambda: self.factory.add_ore(DragonEgg.name, 1))]
+        self.add_button(txx, self.add_ore_action, DragonEgg.name)
 
-        tex = load_from_fontspec('Helvetica', 'sans-serif').render(
-            'Add Elbaite', True, 'white'
-        )
+        tex = render_text('Add Elbaite', 'white', 'Helvetica', 'sans-serif')
         txr = tex.get_rect(top=y, centerx=SC_INFO.player_buttons_area.centerx)
         txx = pygame.draw.rect(dest, Color(50, 50, 50), txr.move_to(
             width=w - 10, height=tex.height + 6, center=txr.center))
         dest.blit(tex, txr)
         y = txx.bottom + 5
-        self.buttons += [(txx, lambda: self.factory.add_ore(Elbaite.name, 1))]
+        self.add_button(txx, self.add_ore_action, Elbaite.name)
 
-        tex = load_from_fontspec('Helvetica', 'sans-serif').render(
-            'Dead', True, 'white'
-        )
+        tex = render_text('Dead', 'white', 'Helvetica', 'sans-serif')
         txr = tex.get_rect(top=y, centerx=SC_INFO.player_buttons_area.centerx)
         txx = pygame.draw.rect(dest, Color(50, 50, 50), txr.move_to(
             width=w - 10, height=tex.height + 6, center=txr.center))
         dest.blit(tex, txr)
         y = txx.bottom + 5
-        self.buttons += [(txx, self.kill)]
+        self.add_button(txx, self.kill)
 
     def petrify_action(self):
-        self.factory.blockedFromPlaying = max(self.factory.blockedFromPlaying, 2)
+        self.state.game.petrify(self.factory)
 
     def use_fireopal_action(self):
         self.state.req_boosting = True
 
+    def add_ore_action(self, ore: str):
+        self.state.game.add_ore(self.factory, ore, 1)
+
+    def build_action(self, buildingType: str):
+        self.state.game.build(self.factory, buildingType)
+
     def render_buy_buttons(self, dest: pygame.Surface):
-        font = load_from_fontspec('Helvetica', 'sans-serif')
         y = 0
-        buttons: list[tuple[IRect, Callable[[], None]]] = []
-        for m_id, cls in backend.MINE_CLASSES.items():
-            if not cls.can_buy_directly:
+        for m_id, entry in backend.CATALOG.items():
+            if not entry.can_buy_directly:
                 continue
-            costs = sorted(cls.cost, key=lambda cost: cost[1])
-            cost_str = (f'{cls.get_abbreviation()}: {cls.productionRate} '
-                        f'{cls.produces.name}/round (COST: '
-                        + ', '.join(f'{n} {ore_s}' for n, ore_s in costs)
-                        + ')')
-            text_color = 'white' if self.factory.can_buy(m_id) else (120, 120, 120)
-            rect_color = ((50,) if self.factory.can_buy(m_id) else (68,)) * 3
-            tex = font.render(cost_str, True, text_color)
+            affordable = self.factory.can_buy(m_id)
+            text_color = 'white' if affordable else (120, 120, 120)
+            rect_color = ((50,) if affordable else (68,)) * 3
+            tex = render_text(entry.label, text_color, 'Helvetica', 'sans-serif')
             btn_rect = pygame.draw.rect(dest, rect_color, IRect(5, y, tex.width + 10, tex.height + 10))
             dest.blit(tex, (5 + 5, y + 5))
             y += tex.height + 15
-            btn_rect_outer = btn_rect.move(Vec2(SC_INFO.player_buy_area.topleft))
-            buttons.append((btn_rect_outer, lambda m_id=m_id: self.factory.createBuilding(m_id)))
-        return buttons
+            self.add_button(btn_rect.move(Vec2(SC_INFO.player_buy_area.topleft)), self.build_action, m_id)
 
     def maybe_show_blocked(self, dest: pygame.Surface):
         if self.state.is_end or not self.factory.blockedFromPlaying:
             return
-        self.buttons = []
-        tex = load_from_fontspec('Helvetica', 'sans-serif',
-                                 bold=True, align=pygame.FONT_CENTER,
-                                 size=100).render(
-            f'BLOCKED\nFOR {self.factory.blockedFromPlaying} TURNS',
-            True, (200,) * 3 + (200,),
-            wraplength=dest.width - 8
-        )
-        tex_shadow = load_from_fontspec('Helvetica', 'sans-serif',
-                                 bold=True, align=pygame.FONT_CENTER,
-                                 size=100).render(
-            f'BLOCKED\nFOR {self.factory.blockedFromPlaying} TURNS',
-            True, 'black',
-            wraplength=dest.width - 8
-        )
-        tex_shadow_c = pygame.Surface(Vec2(tex_shadow.size) + (10, 10), pygame.SRCALPHA)
-        tex_shadow_c.blit(tex_shadow, tex_shadow.get_rect(center=tex_shadow_c.get_rect().center))
-        # tex_shadow_c2 = pygame.Surface(tex_shadow_c.size, pygame.SRCALPHA)
-        tex_shadow_c2 = pygame.transform.box_blur(tex_shadow_c, 5)
-        dest.blit(tex_shadow_c2, tex_shadow_c2.get_rect(center=dest.get_rect().center))
-        dest.blit(tex, tex.get_rect(center=dest.get_rect().center))
+        show_banner(dest, f'BLOCKED\nFOR {self.factory.blockedFromPlaying} TURNS')
 
     def calc_score(self):
-        score = 0
-        special = 0
-        for ore in self.factory.ores:
-            score += ore.amount * ore.value
-            if ore.type in ["DragonEgg", "FireOpal", "Elbaite",
-                            "Yooperlite"] and ore.amount >= 1:
-                special += 1
-        if special == 4:
-            score += 8000
-        else:
-            for ore in self.factory.ores:
-                if ore.type == "DragonEgg":
-                    score = score*1.2**(ore.amount)
-        return score
+        return self.factory.score()
 
     def maybe_show_done(self, dest: pygame.Surface):
         if not self.state.is_end:
             return
-        self.buttons = []
-        text = f'SCORE:\n{self.calc_score():.0f}'
-        tex = load_from_fontspec('Helvetica', 'sans-serif',
-                                 bold=True, align=pygame.FONT_CENTER,
-                                 size=100).render(
-            text, True, (200,) * 3 + (200,),
-            wraplength=dest.width - 8
-        )
-        tex_shadow = load_from_fontspec('Helvetica', 'sans-serif',
-                                        bold=True, align=pygame.FONT_CENTER,
-                                        size=100).render(
-            text, True, 'black',
-            wraplength=dest.width - 8
-        )
-        tex_shadow_c = pygame.Surface(Vec2(tex_shadow.size) + (10, 10), pygame.SRCALPHA)
-        tex_shadow_c.blit(tex_shadow,
-                          tex_shadow.get_rect(center=tex_shadow_c.get_rect().center))
-        # tex_shadow_c2 = pygame.Surface(tex_shadow_c.size, pygame.SRCALPHA)
-        tex_shadow_c2 = pygame.transform.box_blur(tex_shadow_c, 5)
-        dest.blit(tex_shadow_c2, tex_shadow_c2.get_rect(center=dest.get_rect().center))
-        dest.blit(tex, tex.get_rect(center=dest.get_rect().center))
+        show_banner(dest, f'SCORE:\n{self.calc_score():.0f}')
+
+    ## True if the section needs redrawing, its buttons then get collected afresh
+    def _section_changed(self, name: str, key: tuple):
+        self._collecting = self._panel_keys.get(name) != key
+        if self._collecting:
+            self._panel_keys[name] = key
+            self.buttons = self._panel_buttons[name] = []
+            self._panel_hits = None
+        return self._collecting
 
     def render_area(self, dest: pygame.Surface, brightness):
-        dest.fill(self.color.lerp(pygame.Color(0, 0, 0), brightness))
-        self.render_factories(clamped_subsurf(dest, SC_INFO.player_buildings_area))
-        self.render_ores(clamped_subsurf(dest, SC_INFO.player_ores_area))
-        self.buttons += self.render_buy_buttons(clamped_subsurf(dest, SC_INFO.player_buy_area))
-        self.render_side_buttons(dest)
+        if self._panel is None or self._panel.size != dest.size or self._panel_keys.get('brightness') != brightness:
+            self._panel = pygame.Surface(dest.size)
+            self._panel_keys = {'brightness': brightness}
+        panel = self._panel
+        bg = self.color.lerp(pygame.Color(0, 0, 0), brightness)
+        f = self.factory
+        boosting = self.state.req_boosting and self.state.curr_player is self
+        ## Ores, buy buttons and the fire opal button all depend on what's in stock and how full we are
+        wallet = (f.inventory.tobytes(), len(f.ores), len(f.buildings), f.capacity)
+        cols, visible_rows, _ = self._building_grid(SC_INFO.player_buildings_area.size)
+        first = self.building_scroll * cols
+        visible = bytes(f.slots[first:first + visible_rows * cols])
+        if self._section_changed('buildings', (visible, len(f.buildings),
+                                                f.capacity, boosting, self.building_scroll)):
+            panel.fill(bg, SC_INFO.player_buildings_area)
+            self.render_factories(clamped_subsurf(panel, SC_INFO.player_buildings_area))
+        if self._section_changed('ores', wallet):
+            panel.fill(bg, SC_INFO.player_ores_area)
+            self.render_ores(clamped_subsurf(panel, SC_INFO.player_ores_area))
+        if self._section_changed('buy', wallet):
+            panel.fill(bg, SC_INFO.player_buy_area)
+            self.render_buy_buttons(clamped_subsurf(panel, SC_INFO.player_buy_area))
+        if self._section_changed('side', wallet):
+            panel.fill(bg, SC_INFO.player_buttons_area)
+            self.render_side_buttons(panel)
+        self._collecting = False
+        if self._panel_hits is None:
+            self._panel_hits = HitGrid([button for buttons in self._panel_buttons.values() for button in buttons])
+        self.hits = self._panel_hits
+        self._hits_key = None  # So the contracts screen registers its buttons again
+        dest.blit(panel)
         self.maybe_show_blocked(dest)
         self.maybe_show_done(dest)
 
-    def _render_single_contract(self, c: Contract) -> pygame.Surface:
-        tex = load_from_fontspec('Helvetica', 'sans-serif').render(
-            c.to_string(), True, 'white', wraplength=self.area.w // 2 - 20
-        )
-        tex = tex.subsurface(tex.get_bounding_rect())
-        dest = pygame.Surface(tex.get_rect().size + Vec2(6, 6))
-        pygame.draw.rect(dest, pygame.Color(50, 50, 50), dest.get_rect())
-        dest.blit(tex, tex.get_rect(center=dest.get_rect().center))
-        return dest
-
-    def render_contracts(self, dest: pygame.Surface, time):
-        x = y = 5
-        h_max = 1
-        for c in self.all_contracts:
-            # print(time)
-            # print(c.timeLimit)
-            # print('---')
-            if c.timeLimit <= time:
-                continue
-            if c.dead:
-                continue
-            if c.party2 is self.factory:
-                # Reverse it ('without loss of generality, self is c.party1')
-                c = c.op()
-            if c.party1 is not self.factory:
-                continue
-            tex = self._render_single_contract(c)  # TODO
-            w, h = tex.size
-            if x + w > dest.width:
-                x = 5
-                y += h_max + 5  # Next 'line'
-                h_max = 1
-            dest.blit(tex, (x, y))
-            x += w + 5
-            h_max = max(h_max, h)
+    def onclick(self, pos: Vec2):
+        if self.state.is_end or self.factory.blockedFromPlaying:
+            return  # Covered by a banner
+        super().onclick(pos)
+
+    ## Cards laid out in rows as (y, height, [(card, x)]), only redone when the contracts or the width change
+    def _contract_rows(self, width: int):
+        key = (self.all_contracts.revision, width, self.area.w)
+        if self._contract_layout is None or self._contract_layout[0] != key:
+            rows = []
+            row = []
+            x = y = 5
+            h_max = 1
+            for c in self.all_contracts.for_party(self.factory):
+                # Shown from our side ('without loss of generality, self is c.party1')
+                card = render_contract_card(c, 1 if c.party1 is self.factory else 2, self.area.w // 2 - 20)
+                w, h = card.size
+                if x + w > width and row:
+                    rows.append((y, h_max, row))
+                    row = []
+                    x = 5
+                    y += h_max + 5  # Next 'line'
+                    h_max = 1
+                row.append((card, x))
+                x += w + 5
+                h_max = max(h_max, h)
+            if row:
+                rows.append((y, h_max, row))
+            self._contract_layout = (key, rows)
+        return self._contract_layout[1]
+
+    ## Draws the rows that fit, starting at self.contract_scroll
+    def render_contracts(self, dest: pygame.Surface):
+        rows = self._contract_rows(dest.width)
+        self.contract_scroll = max(min(self.contract_scroll, len(rows) - 1), 0)
+        if not rows:
+            return
+        offset = rows[self.contract_scroll][0] - 5
+        for i in range(self.contract_scroll, len(rows)):
+            y, h, row = rows[i]
+            if y - offset >= dest.height:
+                break
+            for card, x in row:
+                dest.blit(card, (x, y - offset))
+
+    def scroll_contracts(self, rows: int):
+        self.contract_scroll = max(self.contract_scroll + rows, 0)
 
     def render_new_contract_button(self, dest: pygame.Surface):
         enabled = len(self.state.players) > 1
@@ -402,35 +568,27 @@ class Player:
         rect_color = ((50,) if enabled else (68,)) * 3
         crect = dest.get_rect().inflate(-10, -10)
         pygame.draw.rect(dest, rect_color, crect)
-        tex = load_from_fontspec('Helvetica', 'sans-serif').render(
-            'Propose contract', True, text_color
-        )
+        tex = render_text('Propose contract', text_color, 'Helvetica', 'sans-serif')
         dest.blit(tex, tex.get_rect(center=dest.get_rect().center))
         if enabled:
-            self.buttons += [(crect.move(Vec2(SC_INFO.contract_new_area.topleft) - SC_INFO.base_player_area.topleft), self.on_new_clicked)]
+            self.add_button(crect.move(Vec2(SC_INFO.contract_new_area.topleft) - SC_INFO.base_player_area.topleft),
+                            self.on_new_clicked)
 
     def on_new_clicked(self):
         self.state.creating_contract = self.factory
 
-    def render_contracts_area(self, dest: pygame.Surface, brightness, time):
+    def render_contracts_area(self, dest: pygame.Surface, brightness):
         dest.fill(self.color.lerp(pygame.Color(0, 0, 0), brightness))
-        self.render_contracts(clamped_subsurf(dest, SC_INFO.contract_list_area), time)
+        self.render_contracts(clamped_subsurf(dest, SC_INFO.contract_list_area))
+        self.begin_buttons(('contracts', len(self.state.players) > 1, dest.size))
         self.render_new_contract_button(clamped_subsurf(dest, SC_INFO.contract_new_area))
+        self.end_buttons()
         self.maybe_show_blocked(dest)
         self.maybe_show_done(dest)
 
-    def onclick(self, pos: Vec2):
-        print('Recv Player.onclick')
-        c_idx = IRect(pos, (1, 1)).collidelist([r for r, _name in self.buttons])
-        if c_idx == -1:
-            print(pos, [r for r, _name in self.buttons])
-            return
-        _, action = self.buttons[c_idx]
-        action()
-
 
 @dataclasses.dataclass
-class Overlay:
+class Overlay(Clickable):
     area_getter: Callable[[], IRect]
     state: State
     players: list[Player]
@@ -440,49 +598,10 @@ class Overlay:
     CANCEL_TEXT = 'Cancel'
     SEND_TEXT = 'Send'
 
-    def begin(self):
-        self.buttons: list[tuple[IRect, Callable[[], None]]] = []
-
     @property
     def area(self):
         return self.area_getter()
 
-    @property
-    def main_section_rel(self):
-        return self.area.scale_by(1, 0.75).move_to(topleft=(0, 0))
-
-    @property
-    def deadline_container_rel(self):
-        return self.area.scale_by(1, 0.1).move_to(topleft=self.main_section_rel.bottomleft)
-
-    @property
-    def deadline_intro_rel(self):
-        return self.deadline_container_rel.scale_by(0.5, 1).move_to(topleft=self.deadline_container_rel.topleft)
-
-    @property
-    def deadline_main_rel(self):
-        return self.deadline_container_rel.scale_by(0.5, 1).move_to(topleft=self.deadline_intro_rel.topright)
-
-    @property
-    def bot_section_rel(self):
-        return self.area.scale_by(1, 0.15).move_to(topleft=self.deadline_container_rel.bottomleft)
-
-    @property
-    def cancel_button_rel(self):
-        return self.bot_section_rel.scale_by(0.5, 1).move_to(topleft=self.bot_section_rel.topleft)
-
-    @property
-    def send_button_rel(self):
-        return self.bot_section_rel.scale_by(0.5, 1).move_to(topright=self.bot_section_rel.topright)
-
-    @property
-    def left_main_rel(self):
-        return self.main_section_rel.scale_by(0.5, 1).move_to(topleft=self.main_section_rel.topleft)
-
-    @property
-    def right_main_rel(self):
-        return self.main_section_rel.scale_by(0.5, 1).move_to(topright=self.main_section_rel.topright)
-
     @property
     def other_players(self):
         return [p.factory for p in self.players if p.factory is not self.current_player]
@@ -496,50 +615,46 @@ class Overlay:
         return self.current.is_null()
 
     def display(self, dest: pygame.Surface):
-        self.begin()
         if self.current_player is None:
+            self.hits = NO_HITS
+            self._hits_key = None
             return
         if self.current is None:
             self.current = Contract(
                 self.current_player, self.other_players[0],
                 [(0, t) for t in backend.TRADE_POSSIBILITIES],
                 [(0, t) for t in backend.TRADE_POSSIBILITIES], self.t + 30)  # TODO DEFAULT
+        c = self.current
+        ## Button positions only move when the numbers (and so the text widths) do
+        self.begin_buttons((dest.size, c.party1, c.party2, tuple(c.terms1), tuple(c.terms2), c.timeLimit))
         # CANCEL
-        cbb = self.cancel_button_rel.inflate(-4, -4)
+        cbb = SC_INFO.overlay_cancel_button_rel.inflate(-4, -4)
         pygame.draw.rect(dest, pygame.Color(50, 50, 50), cbb)
-        tex = load_from_fontspec('Helvetica', 'sans-serif', align=pygame.FONT_CENTER).render(
-            self.CANCEL_TEXT, True, 'white'
-        )
-        dest.blit(tex, tex.get_rect(center=self.cancel_button_rel.center))
+        tex = render_text(self.CANCEL_TEXT, 'white', 'Helvetica', 'sans-serif', align=pygame.FONT_CENTER)
+        dest.blit(tex, tex.get_rect(center=SC_INFO.overlay_cancel_button_rel.center))
         # SEND
-        sbb = self.send_button_rel.inflate(-4, -4)
+        sbb = SC_INFO.overlay_send_button_rel.inflate(-4, -4)
         pygame.draw.rect(dest, pygame.Color(50, 50, 50) if not self.disabled else pygame.Color(68, 68, 68), sbb)
-        tex = load_from_fontspec(
-            'Helvetica', 'sans-serif', align=pygame.FONT_CENTER, strikethrough=self.disabled
-        ).render(
-            self.SEND_TEXT, True, pygame.Color(120, 120, 120) if self.disabled else 'white'
-        )
-        dest.blit(tex, tex.get_rect(center=self.send_button_rel.center))
+        tex = render_text(self.SEND_TEXT, pygame.Color(120, 120, 120) if self.disabled else 'white',
+                          'Helvetica', 'sans-serif', align=pygame.FONT_CENTER, strikethrough=self.disabled)
+        dest.blit(tex, tex.get_rect(center=SC_INFO.overlay_send_button_rel.center))
         # Register buttons, ig
-        self.buttons += [(cbb, self.action_cancel)]
-        self.buttons += [(sbb, self.action_submit)]
+        self.add_button(cbb, self.action_cancel)
+        self.add_button(sbb, self.action_submit)
 
         self.display_deadline(dest)
 
-        self.display_side(clamped_subsurf(dest, self.left_main_rel), self.current.terms1, 1)
-        self.display_side(clamped_subsurf(dest, self.right_main_rel), self.current.terms2, 2)
+        self.display_side(clamped_subsurf(dest, SC_INFO.overlay_left_main_rel), self.current.terms1, 1)
+        self.display_side(clamped_subsurf(dest, SC_INFO.overlay_right_main_rel), self.current.terms2, 2)
+        self.end_buttons()
 
     def display_deadline(self, dest: pygame.Surface):
-        dlc = self.deadline_container_rel.inflate(-4, -4)
+        dlc = SC_INFO.overlay_deadline_container_rel.inflate(-4, -4)
         pygame.draw.rect(dest, pygame.Color(20, 20, 20), dlc)
-        tex = load_from_fontspec('Helvetica', 'sans-serif').render(
-            'Contract deadline (turn number):', True, 'white'
-        )
-        dest.blit(tex, tex.get_rect(center=self.deadline_intro_rel.center))
-        tex = load_from_fontspec('Courier New', 'monospace').render(
-            f'{self.current.timeLimit:^3}', True, 'white'
-        )
-        dest.blit(tex, txr := tex.get_rect(center=self.deadline_main_rel.center))
+        tex = render_text('Contract deadline (turn number):', 'white', 'Helvetica', 'sans-serif')
+        dest.blit(tex, tex.get_rect(center=SC_INFO.overlay_deadline_intro_rel.center))
+        tex = render_text(f'{self.current.timeLimit:^3}', 'white', 'Courier New', 'monospace')
+        dest.blit(tex, txr := tex.get_rect(center=SC_INFO.overlay_deadline_main_rel.center))
         # side=1 to force no texas adjustment
         xl = self._display_button(dest, 1, '<deadline>', tex.height, txr.left, txr.top, -1, is_left=True)
         xl = self._display_button(dest, 1, '<deadline>', tex.height, xl, txr.top, -10, is_left=True)
@@ -554,18 +669,14 @@ class Overlay:
         y = 10  # 5 + pad 5
         pygame.draw.rect(dest, pygame.Color(20, 20, 20), inner)
         if side == 1:
-            tex = load_from_fontspec('Helvetica', 'sans-serif', align=pygame.FONT_CENTER).render(
-                f'You give', True, 'white'
-            )
+            tex = render_text(f'You give', 'white', 'Helvetica', 'sans-serif', align=pygame.FONT_CENTER)
             pygame.draw.rect(dest, pygame.Color(30, 30, 30), tex.get_rect(width=inner.width - 10, centerx=inner.centerx, top=y).inflate(2, 2))
             dest.blit(tex, tex.get_rect(centerx=inner.centerx, top=y))
             y += tex.height + 10  # 5 pad each
         else:
             self._render_player_lr_arrows(dest, y)
-            tex = load_from_fontspec('Helvetica', 'sans-serif',
-                                     align=pygame.FONT_CENTER).render(
-                f'{self.current.party2.name} gives', True, 'white'
-            )
+            tex = render_text(f'{self.current.party2.name} gives', 'white', 'Helvetica', 'sans-serif',
+                              align=pygame.FONT_CENTER)
             pygame.draw.rect(dest, pygame.Color(30, 30, 30),
                              tex.get_rect(width=inner.width - 60, centerx=inner.centerx,
                                           top=y).inflate(2, 2))
@@ -577,9 +688,7 @@ class Overlay:
         heights = []
         for n, t in terms:
             td = "Machine Slot" if t == "Increase slot" else t
-            tex = load_from_fontspec('Helvetica', 'sans-serif').render(
-                f'{td}:', True, 'white'
-            )
+            tex = render_text(f'{td}:', 'white', 'Helvetica', 'sans-serif')
             dest.blit(tex, txr := tex.get_rect(left=inner.left + 8, top=y))
             ys.append(y)
             heights.append(tex.height)
@@ -591,9 +700,7 @@ class Overlay:
             x = self._display_button(dest, side, t, h, x, y, -10, offset=25)
             x = self._display_button(dest, side, t, h, x, y, -1)
 
-            tex = load_from_fontspec('Courier New', 'monospace').render(
-                f'{n:>2}', True, 'white'
-            )
+            tex = render_text(f'{n:>2}', 'white', 'Courier New', 'monospace')
             dest.blit(tex, txr := tex.get_rect(left=x + 20, top=y))
             x = txr.right
 
@@ -608,22 +715,21 @@ class Overlay:
                (dest.width - 24, y + 3)]
         pygame.draw.polygon(dest, pygame.Color(150, 150, 150), rpt)
         rbb = pygame.draw.aalines(dest, pygame.Color(50, 50, 50), True, rpt)
-        self.buttons += [(self.texas(2, lbb), self.pleft), (self.texas(2, rbb), self.pright)]
+        self.add_button(self.texas(2, lbb), self.pleft)
+        self.add_button(self.texas(2, rbb), self.pright)
 
     def _display_button(self, dest: pygame.Surface, side: int, resource: str,
                         h: int, x: int, y: int, n: int, offset: int = 20,
                         is_left: bool = False) -> int:
-        tex = load_from_fontspec('Courier New', 'monospace', size=15).render(
-            f'{f"{n:+}" if abs(n) != 1 else f"{n:+}"[0]}', True, 'white'
-        )
+        tex = render_text(f'{f"{n:+}" if abs(n) != 1 else f"{n:+}"[0]}', 'white', 'Courier New', 'monospace',
+                          size=15)
         txx = IRect().move_to(height=h, width=max(h, tex.width + 10), left=x + offset, top=y)
         if is_left:
             txx.right = x - offset  # overwrite .left
         txr = txx.move_to(size=tex.size, center=txx.center)
         pygame.draw.rect(dest, Color(50, 50, 50), txx, border_radius=8)
         dest.blit(tex, txr)
-        self.buttons += [
-            (self.texas(side, txx), lambda: self.adjust_quantity(side, resource, n))]
+        self.add_button(self.texas(side, txx), self.adjust_quantity, side, resource, n)
         if is_left:
             x = txr.left
         else:
@@ -641,7 +747,7 @@ class Overlay:
     def texas(self, side: int, txx: IRect):
         if side == 1:
             return txx  # no texas required
-        return txx.move(Vec2(self.right_main_rel.topleft) - Vec2(self.main_section_rel.topleft))
+        return txx.move(SC_INFO.overlay_texas_offset)
 
     def adjust_quantity(self, side: int, res: str, amount: int) -> None:
         ls = self.current.terms1 if side == 1 else self.current.terms2
@@ -668,17 +774,9 @@ class Overlay:
         self.postprocess_contract()
         player = next(p for p in self.players if p.factory is self.current.party2)
         player.incoming_contracts.append(self.current)
+        self.state.game.propose(self.current)
         self.current = None
 
-    def onclick(self, pos: Vec2):
-        print('Recv Overlay.onclick')
-        c_idx = IRect(pos, (1, 1)).collidelist([r for r, _name in self.buttons])
-        if c_idx == -1:
-            print(pos, [r for r, _name in self.buttons])
-            return
-        _, action = self.buttons[c_idx]
-        action()
-
 
 # What is this accursed inheritance borne out of sheer laziness?!
 class FinalContractAgreement(Overlay):
@@ -699,12 +797,13 @@ class FinalContractAgreement(Overlay):
         pass  # Nah, no changing target player for you
 
     def action_cancel(self):
+        self.state.game.reject(self.current_player_object.incoming_contracts[0])
         del self.current_player_object.incoming_contracts[0]
         self.current = None
         self.current_player_object = None
 
     def action_submit(self):
-        self.current_player_object.all_contracts.append(self.current)
+        self.state.game.add_contract(self.current)
         del self.current_player_object.incoming_contracts[0]
         self.current = None
         self.current_player_object = None
@@ -712,27 +811,20 @@ class FinalContractAgreement(Overlay):
 
 
 @dataclasses.dataclass
-class BottomMenu:
+class BottomMenu(Clickable):
     area_getter: Callable[[], IRect]
     screen_num: int = 0
 
-    def begin(self):
-        self.buttons: list[tuple[IRect, Callable[[], None]]] = []
-
     @property
     def area(self):
         return self.area_getter()
 
     def display(self, dest: pygame.Surface):
-        font = load_from_fontspec('Helvetica', 'sans-serif')
-        font.align = pygame.FONT_CENTER
-        abt = font.render(
-            'Factories', True, 'white', wraplength=dest.width // 2 - 7
-        )
+        abt = render_text('Factories', 'white', 'Helvetica', 'sans-serif', align=pygame.FONT_CENTER,
+                          wraplength=dest.width // 2 - 7)
         abt_r = abt.get_rect(left=2, centery=dest.get_rect().centery)
-        cbt = font.render(
-            'Contracts', True, 'white', wraplength=dest.width // 2 - 7
-        )
+        cbt = render_text('Contracts', 'white', 'Helvetica', 'sans-serif', align=pygame.FONT_CENTER,
+                          wraplength=dest.width // 2 - 7)
         cbt_r = cbt.get_rect(right=dest.get_rect().right - 2,
                              centery=dest.get_rect().centery)
         abt_rr = abt_r.inflate(2, 2).move_to(height=dest.height - 5, centery=dest.get_rect().centery)
@@ -743,7 +835,10 @@ class BottomMenu:
         dest.blit(abt, abt_r)
         dest.blit(cbt, cbt_r)
 
-        self.buttons = [(abt_rr, self.set_left), (cbt_rr, self.set_right)]
+        self.begin_buttons(dest.size)
+        self.add_button(abt_rr, self.set_left)
+        self.add_button(cbt_rr, self.set_right)
+        self.end_buttons()
 
     def set_left(self):
         self.screen_num = 0
@@ -751,19 +846,9 @@ class BottomMenu:
     def set_right(self):
         self.screen_num = 1
 
-    def onclick(self, pos: Vec2):
-        print('Recv Menu.onclick')
-        c_idx = IRect(pos, (1, 1)).collidelist([r for r, _name in self.buttons])
-        if c_idx == -1:
-            print(pos, [r for r, _name in self.buttons])
-            return
-        _, action = self.buttons[c_idx]
-        action()
-
 
 def render_players_screen(screen: pygame.Surface, players: list[Player], playerTurn):
     for p in players:
-        p.begin()
         # p.render_area(clamped_subsurf(screen, p.area))
         if p.state.is_end:
             brightness = 0.6
@@ -778,125 +863,61 @@ def render_players_screen(screen: pygame.Surface, players: list[Player], playerT
 
 def endgame(players):
     for p in players:
-        score = 0
-        special = 0
-        for ore in p.factory.ores:
-            score += ore.amount*ore.value
-            if ore.type in ["DragonEgg", "FireOpal", "Elbaite", "Yooperlite"] and ore.amount >= 1:
-                special += 1
-        if special == 4:
-            score += 8000
-        else:
-            for ore in p.factory.ores:
-                if ore.type == "DragonEgg":
-                    score = score*1.2**(ore.amount)
-        if special > 4:
-            print("WHATT????")
-            quit()
-        print(f'{p.factory.name} got a score of {score}!')
-        
-
-def demo_factory():
-    factories = []
-    A = False
-    B = False
-    C = False
-    D = False
-    E = False
-    L = False
-    while len(factories) < 4:
-        factoryA = Factory('name', [IronMine()],
-                        [Copper(10), Iron(30), 
-                            *(oc(0) for oc in backend.RESOURCE_CLASSES.values()
-                            if oc != Copper and oc != Iron and oc != NullResource)], 10)
-        factoryB = Factory('name', [CopperMineBasic()],
-                        [Copper(95),
-                            *(oc(0) for oc in backend.RESOURCE_CLASSES.values()
-                            if oc != Copper and oc != NullResource)], 10)
-        factoryC = Factory('name', [CopperMineAdvanced()],
-                        [Copper(5), Iron(15),
-                            *(oc(0) for oc in backend.RESOURCE_CLASSES.values()
-                            if oc != Copper and oc != Iron and oc != NullResource)], 10)
-        factoryD = Factory('name', [IronMine()],
-                        [Copper(0), 
-                            *(oc(0) for oc in backend.RESOURCE_CLASSES.values()
-                            if oc != Copper and oc != NullResource)], 12)
-        factoryE = Factory('name', [CopperMineBasic()],
-                        [Copper(33), Iron(10),
-                            *(oc(0) for oc in backend.RESOURCE_CLASSES.values()
-                            if oc != Copper and oc != Iron and oc != NullResource)], 11)
-        factoryL = Factory('name', [],
-                        [Copper(0), DragonEgg(1), Elbaite(1), Yooperlite(1), FireOpal(1),
-                            *(oc(0) for oc in backend.RESOURCE_CLASSES.values()
-                            if oc != Copper and oc != NullResource and oc != DragonEgg and oc != Elbaite and oc != Yooperlite and oc != FireOpal)], 10)
-        Luck = random.randint(1, 1000)
-        if (Luck < 200 and A == False):
-            factories.append(factoryA)
-            A = True
-        elif (Luck < 399 and B == False):
-            factories.append(factoryB)
-            B = True
-        elif (Luck < 598 and C == False):
-            factories.append(factoryC)
-            C = True
-        elif (Luck < 797 and D == False):
-            factories.append(factoryD)
-            D = True
-        elif (Luck < 996 and E == False):
-            factories.append(factoryE)
-            E = True
-        elif (Luck >= 996 and L == False):
-            factories.append(factoryL)
-            L = True
-    return factories
+        print(f'{p.factory.name} got a score of {p.calc_score()}!')
+
+
+def demo_factory(rng: random.Random | None = None):
+    return [simulation.make_loadout(key) for key in simulation.draw_loadouts(rng or random.Random())]
 
 
 @dataclasses.dataclass
-class Topbar:
+class Topbar(Clickable):
     area_getter: Callable[[], IRect]
     state: State
 
-    def begin(self):
-        self.buttons: list[tuple[IRect, Callable[[], None]]] = []
-
     @property
     def area(self):
         return self.area_getter()
 
     def render(self, dest: pygame.Surface, turn: int):
-        self.begin()
         self.render_turn_count(clamped_subsurf(dest, SC_INFO.turnCount_area), turn)
-        self.render_next_turn(clamped_subsurf(dest, SC_INFO.next_turn_area))
+        blocked = not self.state.is_end and self.state.game.current.blockedFromPlaying > 0
+        self.begin_buttons((dest.size, self.state.is_end, blocked))
+        if blocked:
+            self.render_next_turn(clamped_subsurf(dest, SC_INFO.next_turn_short_area), SC_INFO.next_turn_short_area)
+            self.render_skip_blocked(clamped_subsurf(dest, SC_INFO.skip_blocked_area))
+        else:
+            self.render_next_turn(clamped_subsurf(dest, SC_INFO.next_turn_area), SC_INFO.next_turn_area)
+        self.end_buttons()
 
     def render_turn_count(self, dest: pygame.Surface, turn: int):
-        font = load_from_fontspec('Helvetica', 'sans-serif', align=pygame.FONT_CENTER)
         text = f'Turn {turn}'
-        rendered = font.render(text, antialias=True, color='white', wraplength=dest.width - 5)
+        rendered = render_text(text, 'white', 'Helvetica', 'sans-serif', align=pygame.FONT_CENTER,
+                               wraplength=dest.width - 5)
         dest.blit(rendered, rendered.get_rect().move_to(center=dest.get_rect().center))
 
-    def render_next_turn(self, dest: pygame.Surface):
+    def render_next_turn(self, dest: pygame.Surface, area: IRect):
         text_color = 'white' if not self.state.is_end else (120, 120, 120)
         rect_color = ((50,) if self.state.is_end else (68,)) * 3
         cr = pygame.draw.rect(dest, rect_color, dest.get_rect().inflate(-8, -8))
-        tex = load_from_fontspec('Helvetica', 'sans-serif').render(
-            'Next Turn', True, text_color
-        )
+        tex = render_text('Next Turn', text_color, 'Helvetica', 'sans-serif')
         dest.blit(tex, tex.get_rect().move_to(center=dest.get_rect().center))
         if not self.state.is_end:
-            self.buttons += [(cr.move(Vec2(SC_INFO.next_turn_area.topleft) - SC_INFO.top_area.topleft),
-                              self.next_turn_action)]
+            self.add_button(cr.move(Vec2(area.topleft) - SC_INFO.top_area.topleft), self.next_turn_action)
+
+    ## Fast-forwards past every turn of a blocked player, only shown while the current one is blocked
+    def render_skip_blocked(self, dest: pygame.Surface):
+        cr = pygame.draw.rect(dest, (68,) * 3, dest.get_rect().inflate(-8, -8))
+        tex = render_text('Skip blocked turns', 'white', 'Helvetica', 'sans-serif')
+        dest.blit(tex, tex.get_rect().move_to(center=dest.get_rect().center))
+        self.add_button(cr.move(Vec2(SC_INFO.skip_blocked_area.topleft) - SC_INFO.top_area.topleft),
+                        self.skip_blocked_action)
 
     def next_turn_action(self):
         self.state.req_next_turn = True
 
-    def onclick(self, pos: Vec2):
-        print('Recv Topbar.onclick')
-        c_idx = IRect(pos, (1, 1)).collidelist([r for r, _name in self.buttons])
-        if c_idx == -1:
-            print(pos, [r for r, _name in self.buttons])
-            return
-        _, action = self.buttons[c_idx]
-        action()
+    def skip_blocked_action(self):
+        self.state.req_skip_blocked = True
 
 # def render_turnCount(dest: pygame.Surface, turn):
 #     font = load_from_fontspec('Helvetica', 'sans-serif', align=pygame.FONT_CENTER)
@@ -905,6 +926,28 @@ class Topbar:
 #     dest.blit(rendered, rendered.get_rect().move_to(center=dest.get_rect().center))
 
 
+## The profiler's p50/p95/p99 table (toggled with F3), refreshed every few frames so it can be read
+@dataclasses.dataclass
+class ProfilerOverlay:
+    profiler: FrameProfiler
+    refresh: int = 15
+    table: pygame.Surface | None = None
+
+    def render(self, dest: pygame.Surface):
+        if not self.profiler.show:
+            return
+        if self.table is None or self.profiler.frames % self.refresh == 0:
+            font = load_from_fontspec('Courier New', 'monospace', size=14)
+            rows = [f'{"stage":<14}{"p50":>8}{"p95":>8}{"p99":>8} ms']
+            for name, (p50, p95, p99) in sorted(self.profiler.percentiles().items(), key=lambda item: -item[1][2]):
+                rows.append(f'{name:<14}{p50:>8.2f}{p95:>8.2f}{p99:>8.2f}')
+            tex = font.render('\n'.join(rows), True, 'white')
+            self.table = pygame.Surface(Vec2(tex.size) + (10, 10), pygame.SRCALPHA)
+            self.table.fill((0, 0, 0, 180))
+            self.table.blit(tex, (5, 5))
+        dest.blit(self.table, (5, SC_INFO.top_area.bottom + 5))
+
+
 class MusicPlayer:
     def __init__(self):
         pygame.mixer.init()
@@ -928,8 +971,8 @@ class MusicPlayer:
             self.play_next()
 
 
-def main():
-    MAXTURN = 40
+def main(resume: str | None = None, autosave: str | None = AUTOSAVE, log: str | None = None,
+         seed: int | None = None, profile: str | None = None):
     # pygame setup
     pygame.init()
     pygame.mixer.init()
@@ -937,23 +980,29 @@ def main():
     screen = pygame.Surface(screen_real.size, pygame.SRCALPHA)
     clock = pygame.time.Clock()
     running = True
+    profiler = FrameProfiler(open(profile, 'w') if profile else None)
+    profiler_overlay = ProfilerOverlay(profiler)
 
     music_player = MusicPlayer()
     state = State()
-    contracts = []
-    factories = demo_factory()
-    factories[0].name = "Red"
-    factories[1].name = "Yellow"
-    factories[2].name = "Green"
-    factories[3].name = "Blue"
+    if resume:
+        game = savegame.load(resume).to_game()
+    else:
+        seed = random.randrange(2**32) if seed is None else seed
+        game = Game.new(random.Random(seed), names=["Red", "Yellow", "Green", "Blue"])
+    factories = game.factories
+    if log:
+        ## seed is still None for a resumed game, its log starts from the save instead
+        game.log = ActionLog.create(log, game, seed)
+    contracts = game.contracts
     p1 = Player(pygame.Color("Red"), factories[0],
-                lambda: SC_INFO.base_player_area, contracts, state)
+                lambda: SC_INFO.player_areas[0], contracts, state)
     p2 = Player(pygame.Color("Yellow"), factories[1],
-                lambda: SC_INFO.base_player_area.move(SC_INFO.main_area.w / 2, 0), contracts, state)
+                lambda: SC_INFO.player_areas[1], contracts, state)
     p3 = Player(pygame.Color("Green"), factories[2],
-                lambda: SC_INFO.base_player_area.move(0, SC_INFO.main_area.h / 2), contracts, state)
+                lambda: SC_INFO.player_areas[2], contracts, state)
     p4 = Player(pygame.Color("Blue"), factories[3],
-                lambda: SC_INFO.base_player_area.move(Vec2(SC_INFO.main_area.size) / 2), contracts, state)
+                lambda: SC_INFO.player_areas[3], contracts, state)
     players = [p1, p2, p3, p4]
     #contracts.append(Contract(p1.factory, p2.factory, [(3, "Copper"), (1, "Iron")], [(2, "Copper"), (1, "Increase slot")], 130))
     bm = BottomMenu(lambda: SC_INFO.menu_area)
@@ -962,53 +1011,85 @@ def main():
     olf = FinalContractAgreement(lambda: SC_INFO.overlay_area, state, players)
 
     i = 0
-    t = 0
+    frames_due = 1  # Frames left to draw before main goes back to sleep
+    idle_wall = idle_cpu = 0.0
+    ## Nothing uses it, and it'd wake us up on every twitch of the mouse
+    pygame.event.set_blocked(pygame.MOUSEMOTION)
 
     music_player.start()
     state.curr_player = p1
     state.players = players
+    state.game = game
     while running:
-        playerTurn = t%len(players)
-        if players[playerTurn].dead:
-            players.pop(playerTurn)
-        if len(players) == 1:
+        game.prune()
+        players[:] = [p for p in players if p.factory in game.players]
+        if game.is_end and not state.is_end:
             # We have a winner!
             state.is_end = True
             endgame(players)
+        t = game.t
         playerTurn = t%len(players)
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            if event.type == pygame.WINDOWRESIZED or event.type == pygame.WINDOWSIZECHANGED:
-                new_size = Vec2(event.x, event.y)  # hope surf got resized??
-                SC_INFO.from_sc_size(new_size)
-                screen = pygame.Surface(screen_real.size, pygame.SRCALPHA)
-            if event.type == music_player.music_event:
-                music_player.update(event)
-            if event.type == pygame.MOUSEBUTTONUP:
-                pos = Vec2(event.pos)
-                if players[playerTurn].incoming_contracts:
-                    print('Click -> OverlayFinal')
-                    olf.onclick(pos - olf.area.topleft)
-                elif state.creating_contract is not None:
-                    print('Click -> Overlay')
-                    ol.onclick(pos - ol.area.topleft)
-                else:
-                    print('Click -> Regular')
-                    pl = players[playerTurn]
-                    ## Can't do anything if dead
-                    if not pl.dead:
-                        if pl.factory.blockedFromPlaying <= 0:
-                            ## Can't buy buildings if failed contract recently
-                            if pl.area.collidepoint(pos):
-                                pl.onclick(pos - pl.area.topleft)
-                        else:
-                            print('[blocked]')
-                        if bm.area.collidepoint(pos):
-                            bm.onclick(pos - bm.area.topleft)
-                    if tb.area.collidepoint(pos):
-                        tb.onclick(pos - tb.area.topleft)
-
+        if frames_due:
+            events = pygame.event.get()
+        else:
+            ## Nothing has changed, so sleep until something happens
+            wall, cpu = time.perf_counter(), time.process_time()
+            events = [pygame.event.wait()] + pygame.event.get()
+            idle_wall += time.perf_counter() - wall
+            idle_cpu += time.process_time() - cpu
+        profiler.begin_frame()
+        with profiler.stage('events'):
+            for event in events:
+                if event.type != music_player.music_event:
+                    ## What a click does (pruning, whose turn it is) only shows after the next pass, so draw twice
+                    frames_due = 2
+                if event.type == pygame.QUIT:
+                    running = False
+                if event.type == pygame.WINDOWRESIZED or event.type == pygame.WINDOWSIZECHANGED:
+                    new_size = Vec2(event.x, event.y)  # hope surf got resized??
+                    SC_INFO.from_sc_size(new_size)
+                    if screen.size != screen_real.size:
+                        screen = pygame.Surface(screen_real.size, pygame.SRCALPHA)
+                if event.type == pygame.MOUSEWHEEL:
+                    pos = pygame.mouse.get_pos()
+                    for p in players:
+                        if p.area.collidepoint(pos):
+                            if bm.screen_num == 0:
+                                p.scroll_buildings(-event.y)
+                            else:
+                                p.scroll_contracts(-event.y)
+                if event.type == music_player.music_event:
+                    music_player.update(event)
+                if event.type == pygame.MOUSEBUTTONUP:
+                    pos = Vec2(event.pos)
+                    if players[playerTurn].incoming_contracts:
+                        print('Click -> OverlayFinal')
+                        olf.onclick(pos - olf.area.topleft)
+                    elif state.creating_contract is not None:
+                        print('Click -> Overlay')
+                        ol.onclick(pos - ol.area.topleft)
+                    else:
+                        print('Click -> Regular')
+                        pl = players[playerTurn]
+                        ## Can't do anything if dead
+                        if not pl.dead:
+                            if pl.factory.blockedFromPlaying <= 0:
+                                ## Can't buy buildings if failed contract recently
+                                if pl.area.collidepoint(pos):
+                                    pl.onclick(pos - pl.area.topleft)
+                            else:
+                                print('[blocked]')
+                            if bm.area.collidepoint(pos):
+                                bm.onclick(pos - bm.area.topleft)
+                        if tb.area.collidepoint(pos):
+                            tb.onclick(pos - tb.area.topleft)
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    profiler.toggle()
+
+        if not frames_due:
+            profiler.cancel_frame()
+            continue
+        frames_due = max(frames_due - 1, 0)
         i += 1
         state.curr_player = players[playerTurn]
 
@@ -1021,65 +1102,54 @@ def main():
 
         # render_turnCount(clamped_subsurf(screen, SC_INFO.turnCount_area), t)
         # RENDER YOUR GAME HERE
-        if state.req_next_turn:
-            state.req_next_turn = False
-            state.req_boosting = False
-            bm.screen_num = 0
-
-            t += 1
-            if t == MAXTURN:
-                state.is_end = True
-                endgame(players)
-            else:
-                # Only mine once everyone has had a turn
-                if t%len(players) == 0:
-                    for p in players:
-                        if p.factory.blockedFromPlaying > 0 or p.dead:
-                            p.factory.blockedFromPlaying -= 1
-                            continue
-                        p.factory.mineLoop(collecting=True)
-
-            ## Check if any contracts need to be executed
-            contractsToRemove = []
-            for contract in contracts:
-                if contract.dead:
-                    print("DEAD")
-                    continue
-                contract.dead = True
-                for player in players:
-                    if player.factory == contract.party1:
-                        contract.dead = False
-                contract.dead = True
-                for player in players:
-                    if player.factory == contract.party2:
-                        contract.dead = False
-                if t == contract.timeLimit:
-                    contract.checkFulfilled()  
-
-            ol.t = t
-            olf.t = t
-        bm.display(clamped_subsurf(screen, bm.area))
-        tb.render(clamped_subsurf(screen, tb.area), t)
+        with profiler.stage('turn'):
+            if state.req_next_turn or state.req_skip_blocked:
+                state.req_boosting = False
+                bm.screen_num = 0
+
+                ## Mining, blocked turns and contracts are all handled by the engine
+                if state.req_skip_blocked:
+                    game.skip_blocked()
+                else:
+                    game.next_turn()
+                state.req_next_turn = state.req_skip_blocked = False
+                if autosave:
+                    savegame.save(game, autosave)
+                for settlement in game.ledger:
+                    for party in settlement.defaulted:
+                        print(f"{party.name} has failed to fulfill the contract!")
+                t = game.t
+                if game.is_end and not state.is_end:
+                    state.is_end = True
+                    endgame(players)
+
+                ol.t = t
+                olf.t = t
+        with profiler.stage('menus'):
+            bm.display(clamped_subsurf(screen, bm.area))
+            tb.render(clamped_subsurf(screen, tb.area), t)
         if bm.screen_num == 0:
-            render_players_screen(screen, players, playerTurn)
+            with profiler.stage('players'):
+                render_players_screen(screen, players, playerTurn)
         else:
             assert bm.screen_num == 1
-            for p in players:
-                p.begin()
-                if p.state.is_end:
-                    brightness = 0.6
-                elif p == players[playerTurn]:
-                    brightness = 0.3
-                else:
-                    brightness = 0.9
-                p.render_contracts_area(clamped_subsurf(screen, p.area), brightness, t)
+            with profiler.stage('contracts'):
+                for p in players:
+                    if p.state.is_end:
+                        brightness = 0.6
+                    elif p == players[playerTurn]:
+                        brightness = 0.3
+                    else:
+                        brightness = 0.9
+                    p.render_contracts_area(clamped_subsurf(screen, p.area), brightness)
             # IMPORTANT: LAST
             if state.creating_contract:
                 s = pygame.Surface(screen.size, pygame.SRCALPHA)
                 pygame.draw.rect(s, pygame.Color(0, 0, 0, 129), s.get_rect())
                 screen.blit(s)
                 # pygame.draw.rect(screen, pygame.Color(0, 0, 0, 10), screen.get_rect())
-            ol.display(clamped_subsurf(screen, ol.area))
+            with profiler.stage('overlay'):
+                ol.display(clamped_subsurf(screen, ol.area))
         p = players[playerTurn]
         # print(f'{p.incoming_contracts=}')
         if p.incoming_contracts:
@@ -1089,15 +1159,34 @@ def main():
             c = p.incoming_contracts[0]
             olf.current = c.op()
             olf.current_player_object = p
-            olf.display(clamped_subsurf(screen, olf.area))
-
-
-        screen_real.blit(screen)
-        pygame.display.flip()
+            with profiler.stage('final_overlay'):
+                olf.display(clamped_subsurf(screen, olf.area))
+
+        with profiler.stage('profiler'):
+            profiler_overlay.render(screen)
+        with profiler.stage('flip'):
+            screen_real.blit(screen)
+            pygame.display.flip()
+        profiler.end_frame()
         clock.tick(60)  # limits FPS to 60
 
+    if game.log is not None:
+        game.log.close()
+    profiler.close()
+    if idle_wall:
+        print(f'Idle CPU usage: {idle_cpu / idle_wall:.1%} over {idle_wall:.1f}s idle, {i} frames drawn')
     pygame.quit()
 
 
 if __name__ == '__main__':
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--resume', metavar='SAVE', help='carry on from a save file, e.g. ' + AUTOSAVE)
+    parser.add_argument('--autosave', metavar='SAVE', default=AUTOSAVE, help='where to save after every turn')
+    parser.add_argument('--no-autosave', dest='autosave', action='store_const', const=None)
+    parser.add_argument('--log', metavar='LOG', help='record every action here, see replay.py (overwrites LOG)')
+    parser.add_argument('--seed', type=int, help='seed for the loadout draw of a new game')
+    parser.add_argument('--profile', metavar='FILE', help='write per-frame stage timings here (F3 shows them on screen)')
+    args = parser.parse_args()
+    main(args.resume, args.autosave, args.log, args.seed, args.profile)